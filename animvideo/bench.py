@@ -0,0 +1,293 @@
+import argparse
+import contextlib
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+from animvideo.config import Config
+from animvideo.image import GLOW_COMBO_IMPLEMENTATIONS, GLOW_ENGINE_IMPLEMENTATIONS, FrameBuffer, acquire, release
+from animvideo.plan import RenderPlan
+from animvideo.render import configure
+from animvideo.video import FFmpegVideoProducer
+
+# Stages timed on every frame, in the order they run.
+FRAME_STAGES = ('layout', 'draw', 'glow', 'export', 'write')
+# Stages that run once per case.
+ONCE_STAGES = ('plan', 'encode')
+
+@dataclasses.dataclass(frozen=True)
+class Case:
+    """
+    One combination of settings to benchmark.
+    """
+    impl: str
+    scale_down: int
+    glow_engine: str
+    glow_combo: bool = True
+
+    @property
+    def key(self) -> str:
+        combo = 'combo' if self.glow_combo else 'nocombo'
+        return f"{self.impl}/{self.scale_down}/{self.glow_engine}/{combo}"
+
+    def config(self, **kwargs) -> Config:
+        return Config(IMAGE_IMPL=self.impl, SCALE_DOWN_BASE=self.scale_down, GLOW_ENGINE=self.glow_engine,
+                      GLOW_COMBO=self.glow_combo, **kwargs)
+
+class _Exported:
+    """
+    A frame whose pixels were already exported, so handing it to a producer
+    times the write alone. Panda3D images would render again otherwise.
+    """
+    def __init__(self, buffer: FrameBuffer):
+        self._buffer = buffer
+
+    def as_buffer(self) -> FrameBuffer:
+        return self._buffer
+
+def _peak_rss_mb(who: int) -> float:
+    # Linux reports kilobytes, macOS bytes
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'mean_ms': float(values.mean()),
+        'total_ms': float(values.sum()),
+    }
+
+@contextlib.contextmanager
+def _redirect_output(path: str) -> Iterator[None]:
+    """
+    Sends this process's stdout and stderr to a file, including what FFmpeg
+    and the backends' native code print.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(path, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+def run_case(case: Case, frames: int, skip: int, warmup: int = 1, writer_queue: int = 0, cull: bool = True) -> dict:
+    """
+    Renders and encodes `frames` frames with the case's settings and times
+    each stage, after `warmup` frames that are rendered but not counted.
+
+    The stages are the render plan (once), ring positions and culling
+    (layout), drawing the rings, the glow, getting the pixels out of the
+    backend (export), piping them to FFmpeg (write), and waiting for FFmpeg
+    to finish after the last frame (encode). Panda3D only builds its scene
+    while drawing and renders it during export.
+
+    Run each case in a fresh process, since backends can't be switched
+    cleanly and peak RSS covers the whole process.
+    """
+    with tempfile.TemporaryDirectory(prefix='animvideo-bench-') as output_dir:
+        config = case.config(SKIP=skip, OUTPUT_DIR=output_dir, WRITER_QUEUE=writer_queue, CULL=cull)
+        log_path = os.path.join(output_dir, 'output.log')
+        try:
+            with _redirect_output(log_path):
+                result = _run_case(config, frames, warmup)
+        except Exception as e:
+            with open(log_path) as f:
+                log = f.read()
+            raise RuntimeError(f"Benchmark {case.key} failed: {e}\n{log[-2000:]}") from e
+    return {'key': case.key, **dataclasses.asdict(case), **result}
+
+def _run_case(config: Config, frames: int, warmup: int) -> dict:
+    configure(config)
+    samples: dict[str, list[float]] = {stage: [] for stage in FRAME_STAGES + ONCE_STAGES}
+    clock = time.perf_counter
+
+    start = clock()
+    plan = RenderPlan.from_config(config)
+    samples['plan'].append(clock() - start)
+
+    producer = FFmpegVideoProducer(config.output_path("output.mp4"), config.CANVAS_SIZE, config.OUTPUT_SIZE, config.FPS,
+                                   queue_size=config.WRITER_QUEUE)
+    measured_start = clock()
+    for index in range(warmup + frames):
+        if index == warmup:
+            measured_start = clock()
+        add_rot = index * config.SKIP
+        t0 = clock()
+        if config.CULL:
+            visible = plan.visible(add_rot)
+            centers, radii, colors = plan.centers(add_rot, visible), plan.radii[visible], plan.colors[visible]
+        else:
+            centers, radii, colors = plan.centers(add_rot), plan.radii, plan.colors
+        t1 = clock()
+        image = acquire(config.CANVAS_SIZE, (0, 0, 0))
+        image.rings(centers, radii, colors)
+        t2 = clock()
+        image.glow(radius=config.GLOW_RADIUS)
+        t3 = clock()
+        buffer = image.as_buffer()
+        t4 = clock()
+        producer.add_frame(_Exported(buffer), add_rot)
+        t5 = clock()
+        release(image)
+        if index >= warmup:
+            for stage, elapsed in zip(FRAME_STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                samples[stage].append(elapsed)
+    t0 = clock()
+    producer.finalize()
+    end = clock()
+    samples['encode'].append(end - t0)
+
+    return {
+        'canvas_size': list(config.CANVAS_SIZE),
+        'frames': frames,
+        'fps': frames / (end - measured_start),
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+        'ffmpeg_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        'stages': {stage: _summary(values) for stage, values in samples.items()},
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1, min_ms: float = 1.0) -> list[str]:
+    """
+    Returns a line for every case whose frame rate dropped, whose median
+    stage latency grew, or whose peak RSS grew by more than `tolerance`
+    relative to the baseline. Latencies must also grow by at least `min_ms`,
+    so noise in stages that take next to no time isn't flagged. Only the
+    per-frame stages are compared: the plan and encode stages are a single
+    sample each, too noisy for the same rule.
+    """
+    regressions = []
+    previous = {case['key']: case for case in baseline['cases']}
+    for case in results['cases']:
+        old = previous.get(case['key'])
+        if old is None:
+            continue
+        key = case['key']
+        if case['fps'] < old['fps'] * (1.0 - tolerance):
+            regressions.append(f"{key}: {case['fps']:.2f} fps, was {old['fps']:.2f}")
+        for stage in FRAME_STAGES:
+            if stage not in case['stages'] or stage not in old['stages']:
+                continue
+            now, was = case['stages'][stage]['p50_ms'], old['stages'][stage]['p50_ms']
+            if now > was * (1.0 + tolerance) and now - was >= min_ms:
+                regressions.append(f"{key}: {stage} p50 {now:.1f} ms, was {was:.1f} ms")
+        if case['peak_rss_mb'] > old['peak_rss_mb'] * (1.0 + tolerance):
+            regressions.append(f"{key}: peak RSS {case['peak_rss_mb']:.0f} MB, was {old['peak_rss_mb']:.0f} MB")
+    return regressions
+
+def format_table(results: dict) -> str:
+    """
+    Formats the median stage latencies, frame rate and peak RSS of each case.
+    """
+    stages = FRAME_STAGES + ONCE_STAGES
+    header = ['case', 'fps', *(f'{stage} ms' for stage in stages), 'rss MB']
+    rows = [header]
+    for case in results['cases']:
+        rows.append([case['key'], f"{case['fps']:.2f}",
+                     *(f"{case['stages'][stage]['p50_ms']:.1f}" for stage in stages),
+                     f"{case['peak_rss_mb']:.0f}"])
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(width) if column else cell.ljust(width)
+                               for column, (cell, width) in enumerate(zip(row, widths)))
+                     for row in rows)
+
+def build_cases(impls: list[str], scale_downs: list[int], engines: list[str], combos: list[bool]) -> list[Case]:
+    """
+    Crosses the settings into cases, leaving out the ones that would run the
+    same as another: backends that ignore the glow engine or the glow combo
+    setting get the default only. pygame without the combo always glows
+    with the pyramid, so its cases are keyed as pyramid.
+    """
+    default_values = Config()
+    cases: list[Case] = []
+    for impl, scale_down, engine, combo in itertools.product(impls, scale_downs, engines, combos):
+        if impl not in GLOW_COMBO_IMPLEMENTATIONS:
+            combo = default_values.GLOW_COMBO
+        if impl in GLOW_COMBO_IMPLEMENTATIONS and not combo:
+            engine = 'pyramid'
+        elif impl not in GLOW_ENGINE_IMPLEMENTATIONS:
+            engine = default_values.GLOW_ENGINE
+        case = Case(impl, scale_down, engine, combo)
+        if case not in cases:
+            cases.append(case)
+    return cases
+
+def _bool(value: str) -> bool:
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"Not a boolean: {value}")
+
+def main(argv: Optional[list[str]] = None):
+    default_values = Config()
+
+    parser = argparse.ArgumentParser(description='Time each stage of rendering and encoding frames, per backend, scale and glow engine.')
+    parser.add_argument('--impl', type=lambda value: value.split(','), default=['pillow', 'pygame', 'opencv', 'numpy', 'panda3d'],
+                        help='Comma separated image implementations')
+    parser.add_argument('--scale-down', type=lambda value: [int(scale) for scale in value.split(',')], default=[4],
+                        help='Comma separated scale down factors')
+    parser.add_argument('--glow-engine', type=lambda value: value.split(','), default=[default_values.GLOW_ENGINE],
+                        help='Comma separated glow engines (gaussian, pyramid)')
+    parser.add_argument('--glow-combo', type=lambda value: [_bool(combo) for combo in value.split(',')], default=[default_values.GLOW_COMBO],
+                        help='Comma separated glow combo settings, e.g. true,false')
+    parser.add_argument('--frames', type=int, default=20, help='Frames to time per case')
+    parser.add_argument('--warmup', type=int, default=2, help='Frames to render first without timing them')
+    parser.add_argument('--skip', type=int, default=default_values.SKIP, help='Rotation between frames')
+    parser.add_argument('--writer-queue', type=int, default=default_values.WRITER_QUEUE, help='Frames to buffer for a background FFmpeg writer thread')
+    parser.add_argument('--no-cull', dest='cull', action='store_false', default=default_values.CULL, help='Draw every ring, including those off the canvas')
+    parser.add_argument('--output', type=str, default='', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', type=str, default='', help='Compare with results saved by an earlier --output')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative slowdown or growth that counts as a regression')
+    parsed = parser.parse_args(argv)
+
+    cases = build_cases(parsed.impl, parsed.scale_down, parsed.glow_engine, parsed.glow_combo)
+    results = {
+        'settings': {'frames': parsed.frames, 'warmup': parsed.warmup, 'skip': parsed.skip,
+                     'writer_queue': parsed.writer_queue, 'cull': parsed.cull},
+        'cases': [],
+    }
+    for case in cases:
+        print(f"Benchmarking {case.key}", flush=True)
+        # A fresh process per case, so backends don't share state and peak
+        # RSS is the case's own. Start-up isn't timed.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results['cases'].append(executor.submit(run_case, case, parsed.frames, parsed.skip, parsed.warmup,
+                                                    parsed.writer_queue, parsed.cull).result())
+    print(format_table(results))
+
+    if parsed.output:
+        with open(parsed.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if parsed.baseline:
+        with open(parsed.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != results['settings']:
+            print(f"Baseline settings {baseline['settings']} differ from {results['settings']}")
+        regressions = compare(results, baseline, parsed.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against '{parsed.baseline}'.")
+
+if __name__ == "__main__":
+    main()
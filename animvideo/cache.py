@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional
+from animvideo.config import Config
+from animvideo.image import GLOW_COMBO_IMPLEMENTATIONS, GLOW_ENGINE_IMPLEMENTATIONS
+
+# The Config fields that change what a frame looks like. Frames are drawn
+# from add_rot alone, so the frame range, SKIP and the output settings
+# don't matter.
+_RENDER_FIELDS = (
+    'CANVAS_SIZE', 'OUTER_RADIUS', 'INNER_RADIUS', 'ADJUSTMENT', 'LEVELS', 'COLORS0', 'COLORS1',
+    'IMAGE_IMPL', 'GLOW_COMBO', 'GLOW_RADIUS', 'GLOW_ENGINE', 'GLOW_QUALITY', 'FFMPEG_GLOW', 'RING_SPRITES',
+)
+
+def render_key(config: Config) -> str:
+    """
+    Returns a hash of everything in the config that affects the pixels of a
+    frame.
+    """
+    fields = {name: getattr(config, name) for name in _RENDER_FIELDS}
+    if config.IMAGE_IMPL not in GLOW_ENGINE_IMPLEMENTATIONS:
+        # Same pixels whichever engine is selected
+        del fields['GLOW_ENGINE'], fields['GLOW_QUALITY']
+    if config.IMAGE_IMPL not in GLOW_COMBO_IMPLEMENTATIONS:
+        del fields['GLOW_COMBO']
+    elif not config.GLOW_COMBO:
+        del fields['GLOW_ENGINE']
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+
+class FrameCache:
+    """
+    An on-disk cache of rendered frames, shared by every run that renders
+    with the same settings. Runs with a different SKIP or frame range reuse
+    the frames they have in common.
+
+    Frames are stored as raw RGB files named after the render key and
+    add_rot. Reading a frame refreshes its modification time, and once the
+    directory grows past max_bytes the least recently used frames are
+    deleted. Files are written under a temporary name and renamed into
+    place, so concurrent runs and render workers can share a directory.
+
+    The size of the directory is scanned once, then kept up to date with
+    the frames this process writes. The directory is only scanned again
+    when that total goes past max_bytes, so frames written by other
+    processes in the meantime can take it a little over the limit.
+    """
+    def __init__(self, directory: str, config: Config, max_bytes: int = 4 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.key = render_key(config)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._scan())
+
+    def _path(self, add_rot: int) -> str:
+        return os.path.join(self.directory, f"{self.key}_{add_rot:06d}.rgb")
+
+    def get(self, add_rot: int) -> Optional[bytes]:
+        """
+        Returns the cached pixels of a frame, or None if it isn't cached.
+        """
+        path = self._path(add_rot)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Also covers a frame evicted by another process in between
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, add_rot: int, data: bytes):
+        """
+        Stores the pixels of a frame, then evicts frames until the cache fits
+        in max_bytes.
+        """
+        path = self._path(add_rot)
+        try:
+            # A frame written by another process in the meantime is replaced
+            self._bytes -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._bytes += len(data)
+        if self._bytes > self.max_bytes:
+            self._evict()
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        """
+        Returns the modification time, size and path of every cached frame,
+        oldest first.
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.rgb'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def _evict(self):
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        # Never evict the frame just written, even if it alone is too big
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
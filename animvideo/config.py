@@ -35,15 +35,46 @@ class Config:
     START_FRAME_BASE: int = 0
     END_FRAME_BASE: int = -1
     MODE: Mode = Mode.FULL
+    THUMB_PRODUCER: str = 'stream'
+    SEQUENCE_FORMAT: str = ''
+    SEQUENCE_PNG_LEVEL: int = 1
+    SEQUENCE_THREADS: int = 4
+    THUMB_INTERVAL: int = 100
+    FRAME_LIST: List[int] = field(default_factory=list)
     COLORS0_BASE: List[str|tuple[int, int, int]] = field(default_factory=lambda: ['blue', 'green', 'yellow', 'red'])
     COLORS1_BASE: List[str|tuple[int, int, int]] = field(default_factory=lambda: ['cyan', 'yellow', 'orange', 'magenta'])
     IMAGE_IMPL: str = 'pygame'
     GLOW_COMBO: bool = True
     GLOW_RADIUS_BASE: int = 180
+    GLOW_ENGINE: str = 'gaussian'
+    GLOW_QUALITY: float = 4.0
+    FFMPEG_GLOW: bool = False
+    WORKERS: int = 1
+    SHARED_FRAMES: bool = False
+    CULL: bool = True
+    WRITER_QUEUE: int = 0
+    SEGMENTS: int = 1
+    GOP: int = 0
+    RING_SPRITES: bool = False
+    RING_SPRITE_CACHE_MB: int = 256
+    FRAME_CACHE_DIR: str = ''
+    FRAME_CACHE_MB: int = 4096
+    TILE_SIZE: int = 0
+    IMAGE_POOL: int = 2
+    TRACE: bool = False
+    PROFILE_EVERY: int = 0
+    FFMPEG_STALL_TIMEOUT: float = 30.0
+    FRAME_PREP: bool = False
+    FRAME_PREP_THREADS: int = 4
+
+    @property
+    def NATIVE_OUTPUT(self) -> bool:
+        """Whether the backend renders smooth edges at the output size, rather than at twice the size for FFmpeg to scale down."""
+        return self.IMAGE_IMPL in ('panda3d', 'numpy')
 
     @property
     def SCALE_DOWN(self) -> int:
-        return self.SCALE_DOWN_BASE if self.IMAGE_IMPL != 'panda3d' else self.SCALE_DOWN_BASE * 2
+        return self.SCALE_DOWN_BASE if not self.NATIVE_OUTPUT else self.SCALE_DOWN_BASE * 2
 
     @property
     def OUTER_RADIUS(self) -> int:
@@ -57,6 +88,14 @@ class Config:
     def CANVAS_SIZE(self) -> Tuple[int, int]:
         return (self.CANVAS_SIZE_BASE[0] // self.SCALE_DOWN, self.CANVAS_SIZE_BASE[1] // self.SCALE_DOWN)
 
+    @property
+    def OUTPUT_SIZE(self) -> Tuple[int, int]:
+        return self.CANVAS_SIZE if self.NATIVE_OUTPUT else (self.CANVAS_SIZE[0] // 2, self.CANVAS_SIZE[1] // 2)
+
+    @property
+    def THUMB_SIZE(self) -> Tuple[int, int]:
+        return (self.CANVAS_SIZE[0] // 2, self.CANVAS_SIZE[1] // 2)
+
     @property
     def FRAMES(self) -> int:
         return int(self.SECONDS * self.FPS * self.SKIP)
@@ -1,6 +1,9 @@
-from animvideo.image._img import Img
+from animvideo.image._img import Img, FrameBuffer
 from typing import Type, Callable
-from animvideo.image._config import set_use_opencv_for_glow
+import animvideo.image._config as _config
+from animvideo.image._config import set_use_opencv_for_glow, set_ring_sprite_cache, get_ring_sprite_cache, set_glow_engine, set_image_pool, get_image_pool
+from animvideo.image._sprites import RingSpriteCache
+from animvideo.image._pool import ImagePool
 
 def _import_OpenCVImage() -> Type[Img]:
     from animvideo.image._opencv import _OpenCVImage
@@ -18,8 +21,19 @@ def _import_Panda3dImage() -> Type[Img]:
     from animvideo.image._panda3d import _Panda3dImage
     return _Panda3dImage
 
+def _import_NumpyImage() -> Type[Img]:
+    from animvideo.image._numpy import _NumpyImage
+    return _NumpyImage
+
 _thunk: Callable[[], Type[Img]] = _import_Panda3dImage
 
+# Implementations whose glow() follows set_glow_engine(). The NumPy backend
+# always blurs with its own box filters, and Panda3D doesn't glow.
+GLOW_ENGINE_IMPLEMENTATIONS = ('opencv', 'pygame', 'pillow')
+# Implementations whose glow() set_use_opencv_for_glow() changes. Without
+# it, pygame always glows with the pyramid engine.
+GLOW_COMBO_IMPLEMENTATIONS = ('pygame',)
+
 def set_implementation(name: str):
     global _thunk
     if name == 'opencv':
@@ -30,8 +44,38 @@ def set_implementation(name: str):
         _thunk = _import_PillowImage
     elif name == 'panda3d':
         _thunk = _import_Panda3dImage
+    elif name == 'numpy':
+        _thunk = _import_NumpyImage
     else:
         raise ValueError(f"Unknown implementation: {name}")
 
+def get_implementation() -> Type[Img]:
+    """
+    Returns the image class of the selected implementation.
+    """
+    return _thunk()
+
 def empty(size: tuple[int, int], color: tuple[int, int, int] = (0, 0, 0)) -> Img:
     return _thunk().empty(size, color)
+
+def frombytes(size: tuple[int, int], data: bytes) -> Img:
+    return _thunk().frombytes(size, data)
+
+def acquire(size: tuple[int, int], color: tuple[int, int, int] = (0, 0, 0)) -> Img:
+    """
+    Like empty(), but reuses a released image if there is an image pool.
+    """
+    pool = _config._image_pool
+    if pool is None:
+        return empty(size, color)
+    return pool.acquire(_thunk(), size, color)
+
+def release(image: Img):
+    """
+    Hands an image back to the image pool, or destroys it if there is none.
+    """
+    pool = _config._image_pool
+    if pool is None:
+        image.destroy()
+    else:
+        pool.release(image)
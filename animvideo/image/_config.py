@@ -3,3 +3,46 @@ _use_opencv_for_glow = False
 def set_use_opencv_for_glow(value: bool):
     global _use_opencv_for_glow
     _use_opencv_for_glow = value
+
+_ring_sprite_cache = None
+
+def set_ring_sprite_cache(cache):
+    """
+    Makes the CPU backends blit rings from the given RingSpriteCache, or
+    draw them directly if it is None.
+    """
+    global _ring_sprite_cache
+    _ring_sprite_cache = cache
+
+def get_ring_sprite_cache():
+    return _ring_sprite_cache
+
+_image_pool = None
+
+def set_image_pool(pool):
+    """
+    Makes acquire() and release() reuse images through the given ImagePool,
+    or allocate and destroy them if it is None.
+    """
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.destroy()
+    _image_pool = pool
+
+def get_image_pool():
+    return _image_pool
+
+_glow_engine = 'gaussian'
+_glow_quality = 4.0
+
+def set_glow_engine(engine: str, quality: float = 4.0):
+    """
+    Selects how glow() blurs: 'gaussian' for a full size Gaussian, or
+    'pyramid' for a faster approximation through an image pyramid. Higher
+    quality makes the pyramid more accurate and slower.
+    """
+    global _glow_engine, _glow_quality
+    if engine not in ('gaussian', 'pyramid'):
+        raise ValueError(f"Unknown glow engine: {engine}")
+    _glow_engine = engine
+    _glow_quality = quality
@@ -1,4 +1,17 @@
 import abc
+import numpy as np
+from typing import NamedTuple, Optional
+
+class FrameBuffer(NamedTuple):
+    """
+    Raw pixel data exported from an image without copying.
+    """
+    # The pixels, row by row with no padding between rows.
+    data: memoryview
+    # The FFmpeg name of the pixel format, e.g. 'rgb24', 'bgr24' or 'bgr0'.
+    pix_fmt: str
+    # Whether the bottom row comes first.
+    bottom_up: bool = False
 
 class Img(abc.ABC):
     """
@@ -24,6 +37,47 @@ class Img(abc.ABC):
         """
         ...
 
+    @classmethod
+    @abc.abstractmethod
+    def frombytes(cls, size: tuple[int, int], data: bytes) -> 'Img':
+        """
+        Creates a new image from raw pixel data, as returned by tobytes().
+
+        Args:
+            size (tuple[int, int]): The size of the image.
+            data (bytes): The RGB pixel data, top row first.
+
+        Returns:
+            Img: The new image.
+        """
+        ...
+
+    @classmethod
+    def wrap(cls, pixels: np.ndarray) -> Optional['Img']:
+        """
+        Creates an image that draws straight into an existing array, such as
+        a slot of shared memory, without copying it.
+
+        Backends that keep their pixels elsewhere return None.
+
+        Args:
+            pixels (np.ndarray): RGB pixels of shape (height, width, 3).
+
+        Returns:
+            Img: The image, or None.
+        """
+        return None
+
+    @abc.abstractmethod
+    def clear(self, color: tuple[int, int, int] = (0, 0, 0)):
+        """
+        Fills the whole image with a color, reusing its storage.
+
+        Args:
+            color (tuple[int, int, int]): The color to fill with.
+        """
+        ...
+
     @abc.abstractmethod
     def save(self, filename: str):
         """
@@ -44,6 +98,20 @@ class Img(abc.ABC):
         """
         ...
 
+    def as_buffer(self) -> FrameBuffer:
+        """
+        Exposes the pixel data in whatever layout the backend stores it, so
+        it can be written out without an intermediate copy. The buffer is
+        only valid until the image is next changed or destroyed.
+
+        Backends that can't share their storage return a copy made with
+        tobytes().
+
+        Returns:
+            FrameBuffer: The pixel data and its format.
+        """
+        return FrameBuffer(memoryview(self.tobytes()), 'rgb24')
+
     @property
     @abc.abstractmethod
     def size(self) -> tuple[int, int]:
@@ -71,6 +139,26 @@ class Img(abc.ABC):
         """
         ...
 
+    def rings(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        """
+        Draws many rings on the image, in order. Backends override this to
+        avoid the per-ring overhead of ring().
+
+        Args:
+            centers (np.ndarray): An (N, 2) array of ring centers.
+            radii (np.ndarray): An (N, 2) array of inner and outer radii.
+            colors (np.ndarray): An (N, 3) array of RGB colors.
+            origin (tuple[int, int], optional): Where the image's top left
+                corner is on a larger canvas that the centers refer to. The
+                rings come out exactly as they would on that canvas.
+                Defaults to (0, 0).
+        """
+        if origin != (0, 0):
+            centers = centers - np.asarray(origin, dtype=np.float64)
+        for (center_x, center_y), (inner_radius, outer_radius), color in zip(centers.tolist(), radii.tolist(), colors.tolist()):
+            self.ring(color=tuple(color), inner_radius=inner_radius, outer_radius=outer_radius,
+                      center_x=center_x, center_y=center_y)
+
     @abc.abstractmethod
     def ellipse(self, bbox: tuple[int, int, int, int], fill: tuple[int, int, int] = (0, 0, 0)):
         """
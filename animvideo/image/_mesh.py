@@ -0,0 +1,91 @@
+import math
+import numpy as np
+from panda3d.core import (
+    Geom,
+    GeomNode,
+    GeomTriangles,
+    GeomVertexArrayFormat,
+    GeomVertexData,
+    GeomVertexFormat,
+)
+
+# Inner radius of the ring geometry, relative to the outer radius.
+INNER_SCALE = 0.5
+
+def ring_segments(radius: float, tolerance: float = 0.25, minimum: int = 8) -> int:
+    """
+    Returns how many straight segments a ring of the given on-screen radius
+    needs so its edge is never more than `tolerance` pixels inside the true
+    circle.
+    """
+    if radius <= tolerance:
+        return minimum
+    return max(minimum, math.ceil(math.pi / math.acos(1.0 - tolerance / radius)))
+
+_vertex_format = None
+
+def _get_vertex_format() -> GeomVertexFormat:
+    # Positions and colors as floats, interleaved in one array so it can be
+    # filled with a single copy. Float colors keep the exact shades the
+    # per-node colors used to give.
+    global _vertex_format
+    if _vertex_format is None:
+        array = GeomVertexArrayFormat()
+        array.add_column('vertex', 3, Geom.NT_float32, Geom.C_point)
+        array.add_column('color', 4, Geom.NT_float32, Geom.C_color)
+        _vertex_format = GeomVertexFormat.register_format(GeomVertexFormat(array))
+    return _vertex_format
+
+def ring_mesh(name: str, centers: np.ndarray, outer_radii: np.ndarray, colors: np.ndarray, segments: int) -> GeomNode:
+    """
+    Builds a single GeomNode holding many rings as indexed triangles with a
+    color per vertex, filled from NumPy arrays instead of one node per ring.
+
+    Args:
+        centers (np.ndarray): An (N, 2) array of ring centers.
+        outer_radii (np.ndarray): The N outer radii. Inner radii are
+            INNER_SCALE times these.
+        colors (np.ndarray): An (N, 3) array of RGB colors from 0 to 255.
+        segments (int): Straight segments per ring, see ring_segments().
+    """
+    count = len(centers)
+    node = GeomNode(name)
+    if count == 0:
+        return node
+    theta = np.arange(segments) * (2.0 * math.pi / segments)
+    # Unit ring, alternating inner and outer vertices like a triangle strip
+    unit = np.empty((2 * segments, 2), dtype=np.float64)
+    unit[0::2, 0] = INNER_SCALE * np.cos(theta)
+    unit[0::2, 1] = INNER_SCALE * np.sin(theta)
+    unit[1::2, 0] = np.cos(theta)
+    unit[1::2, 1] = np.sin(theta)
+
+    vertices = np.empty((count, 2 * segments, 7), dtype=np.float32)
+    vertices[:, :, 0:2] = centers[:, np.newaxis, :] + unit * np.asarray(outer_radii, dtype=np.float64)[:, np.newaxis, np.newaxis]
+    vertices[:, :, 2] = 0.0
+    vertices[:, :, 3:6] = (np.asarray(colors, dtype=np.float64) / 255.0)[:, np.newaxis, :]
+    vertices[:, :, 6] = 1.0
+
+    vdata = GeomVertexData(name, _get_vertex_format(), Geom.UH_static)
+    vdata.unclean_set_num_rows(count * 2 * segments)
+    memoryview(vdata.modify_array(0)).cast('B').cast('f')[:] = memoryview(vertices.reshape(-1))
+
+    # The two triangles between segment i and i + 1, wound the way the
+    # strip would wind them
+    inner = np.arange(segments) * 2
+    outer = inner + 1
+    next_inner = (inner + 2) % (2 * segments)
+    next_outer = next_inner + 1
+    quad = np.stack([inner, outer, next_inner, next_inner, outer, next_outer], axis=1).reshape(-1)
+    indices = (quad[np.newaxis, :] + (np.arange(count) * 2 * segments)[:, np.newaxis]).astype(np.uint32)
+
+    prim = GeomTriangles(Geom.UH_static)
+    prim.set_index_type(Geom.NT_uint32)
+    index_array = prim.modify_vertices()
+    index_array.unclean_set_num_rows(indices.size)
+    memoryview(index_array).cast('B').cast('I')[:] = memoryview(indices.reshape(-1))
+
+    geom = Geom(vdata)
+    geom.add_primitive(prim)
+    node.add_geom(geom)
+    return node
@@ -0,0 +1,207 @@
+from animvideo.image._img import Img, FrameBuffer
+from PIL import Image
+import numpy as np
+import math
+from animvideo.image._coverage import annulus_coverage
+from animvideo.image._glow import ksize_sigma
+
+# Most rings drawn in one vectorized pass. Bounds the size of the per-batch
+# coverage arrays.
+_MAX_BATCH = 512
+
+def _box_sizes(sigma: float, passes: int = 3) -> list[int]:
+    """
+    Returns the widths of `passes` box filters whose combination
+    approximates a Gaussian with the given sigma.
+    """
+    ideal = math.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(ideal)
+    if lower % 2 == 0:
+        lower -= 1
+    lower = max(lower, 1)
+    upper = lower + 2
+    m = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if i < m else upper for i in range(passes)]
+
+# Float32 buffers reused by glow(), by use. They grow to the largest size
+# asked for, so frames after the first allocate nothing.
+_scratch: dict[str, np.ndarray] = {}
+
+def _scratch_view(name: str, shape: tuple[int, ...]) -> np.ndarray:
+    """
+    Returns a float32 array of the given shape backed by a reused buffer.
+    Its contents are undefined.
+    """
+    size = math.prod(shape)
+    buffer = _scratch.get(name)
+    if buffer is None or buffer.size < size:
+        buffer = _scratch[name] = np.empty(size, dtype=np.float32)
+    return buffer[:size].reshape(shape)
+
+def _box_blur(a: np.ndarray, width: int, axis: int):
+    """
+    Box blurs a float32 array in place along one axis using a running sum,
+    reflecting at the edges like OpenCV's default border.
+    """
+    n = a.shape[axis]
+    r = min(width // 2, n - 1)
+    if r <= 0:
+        return
+
+    def along(part: slice) -> tuple[slice, ...]:
+        index = [slice(None)] * a.ndim
+        index[axis] = part
+        return tuple(index)
+
+    shape = list(a.shape)
+    shape[axis] = n + 2 * r + 1
+    padded = _scratch_view('padded', tuple(shape))
+    if r + 1 < n:
+        padded[along(slice(r + 1, r + 1 + n))] = a
+        padded[along(slice(0, r + 1))] = a[along(slice(r + 1, 0, -1))]
+        padded[along(slice(r + 1 + n, None))] = a[along(slice(n - 2, n - 2 - r, -1))]
+    else:
+        # Reflects more than once, only for tiny images
+        pad = [(0, 0)] * a.ndim
+        pad[axis] = (r + 1, r)
+        padded[:] = np.pad(a, pad, mode='reflect')
+    sums = _scratch_view('sums', tuple(shape))
+    np.cumsum(padded, axis=axis, out=sums)
+    np.subtract(sums[along(slice(2 * r + 1, None))], sums[along(slice(0, n))], out=a)
+    a *= 1.0 / (2 * r + 1)
+
+class _NumpyImage(Img):
+    """
+    A pure NumPy backend that draws anti-aliased shapes with vectorized
+    coverage evaluation. Since edges are smooth it can render directly at
+    the output resolution.
+    """
+    def __init__(self, pixels: np.ndarray):
+        # RGB, (height, width, 3)
+        self._pixels = pixels
+
+    @classmethod
+    def empty(cls, size: tuple[int, int], color: tuple[int, int, int] = (0, 0, 0)) -> 'Img':
+        pixels = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        pixels[:] = color
+        return cls(pixels)
+
+    @classmethod
+    def frombytes(cls, size: tuple[int, int], data: bytes) -> 'Img':
+        return cls(np.frombuffer(data, dtype=np.uint8).reshape((size[1], size[0], 3)).copy())
+
+    @classmethod
+    def wrap(cls, pixels: np.ndarray) -> 'Img':
+        return cls(pixels)
+
+    def clear(self, color: tuple[int, int, int] = (0, 0, 0)):
+        self._pixels[:] = color
+
+    def save(self, filename: str):
+        Image.fromarray(self._pixels).save(filename, compress_level=1)
+
+    def tobytes(self) -> bytes:
+        return self._pixels.tobytes()
+
+    def as_buffer(self) -> FrameBuffer:
+        pixels = np.ascontiguousarray(self._pixels)
+        return FrameBuffer(memoryview(pixels.reshape(-1)), 'rgb24')
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return (self._pixels.shape[1], self._pixels.shape[0])
+
+    def ring(self, color: tuple[int, int, int], inner_radius: int, outer_radius: int, center_x: int, center_y: int, rotation: float = 0.0):
+        center = (center_x, center_y)
+        if rotation != 0.0:
+            offset = (self.size[0] // 2, self.size[1] // 2)
+            center = (center[0] - offset[0], center[1] - offset[1])
+            sine = math.sin(rotation)
+            cosine = math.cos(rotation)
+            center = (center[0] * cosine - center[1] * sine, center[0] * sine + center[1] * cosine)
+            center = (center[0] + offset[0], center[1] + offset[1])
+        self.rings(np.array([center], dtype=np.float64), np.array([(inner_radius, outer_radius)]), np.array([color], dtype=np.float64))
+
+    def rings(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        # Consecutive rings with the same radii are drawn together, up to
+        # _MAX_BATCH at a time, with one coverage evaluation per batch.
+        breaks = np.flatnonzero((radii[1:] != radii[:-1]).any(axis=1)) + 1
+        bounds = [0, *breaks.tolist(), len(centers)]
+        for start, end in zip(bounds, bounds[1:]):
+            for batch in range(start, end, _MAX_BATCH):
+                stop = min(batch + _MAX_BATCH, end)
+                self._draw_batch(centers[batch:stop], radii[batch], colors[batch:stop], origin)
+
+    def _draw_batch(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        inner_radius, outer_radius = float(radii[0]), float(radii[1])
+        width, height = self.size
+        # Every ring gets the same square bounding box, with a pixel of margin
+        # for the anti-aliased edge.
+        reach = int(math.ceil(outer_radius)) + 1
+        span = np.arange(2 * reach + 1)
+        origins = np.floor(centers).astype(np.int64) - reach
+        xs = origins[:, 0:1] + span  # (K, side)
+        ys = origins[:, 1:2] + span
+        dx = (xs - centers[:, 0:1])[:, np.newaxis, :]
+        dy = (ys - centers[:, 1:2])[:, :, np.newaxis]
+        # Coverage is evaluated on the canvas, pixels are addressed in the image
+        xs = xs - origin[0]
+        ys = ys - origin[1]
+        coverage = annulus_coverage(dx, dy, inner_radius, outer_radius).astype(np.float32)
+
+        inside = (coverage > 0.0) & ((xs >= 0) & (xs < width))[:, np.newaxis, :] & ((ys >= 0) & (ys < height))[:, :, np.newaxis]
+        ring_index, row, column = np.nonzero(inside)
+        if len(ring_index) == 0:
+            return
+        flat = self._pixels.reshape((-1, 3))
+        index = ys[ring_index, row] * width + xs[ring_index, column]
+        alpha = coverage[ring_index, row, column][:, np.newaxis]
+        color = colors[ring_index].astype(np.float32)
+        # Rings in the animation only touch at their anti-aliased edges, so
+        # few pixels are hit more than once. Rank each hit among the hits of
+        # its pixel and blend one rank at a time, which gives the same result
+        # as drawing the rings one after the other.
+        order = np.argsort(index, kind='stable')
+        sorted_index = index[order]
+        first = np.flatnonzero(np.r_[True, sorted_index[1:] != sorted_index[:-1]])
+        counts = np.diff(np.r_[first, len(sorted_index)])
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order)) - np.repeat(first, counts)
+        for r in range(int(counts.max())):
+            hits = np.flatnonzero(rank == r)
+            target = index[hits]
+            blended = flat[target] * (1.0 - alpha[hits]) + color[hits] * alpha[hits]
+            flat[target] = np.rint(blended).astype(np.uint8)
+
+    def ellipse(self, bbox: tuple[int, int, int, int], fill: tuple[int, int, int] = (0, 0, 0)):
+        x0, y0, x1, y1 = bbox
+        center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+        radius_x, radius_y = max((x1 - x0) / 2, 1e-6), max((y1 - y0) / 2, 1e-6)
+        width, height = self.size
+        left, right = max(int(math.floor(x0)) - 1, 0), min(int(math.ceil(x1)) + 2, width)
+        top, bottom = max(int(math.floor(y0)) - 1, 0), min(int(math.ceil(y1)) + 2, height)
+        if left >= right or top >= bottom:
+            return
+        dx = (np.arange(left, right) - center_x)[np.newaxis, :] / radius_x
+        dy = (np.arange(top, bottom) - center_y)[:, np.newaxis] / radius_y
+        # Scale the normalized distance back to pixels along the shorter axis
+        edge = (1.0 - np.sqrt(dx * dx + dy * dy)) * min(radius_x, radius_y)
+        alpha = np.clip(edge + 0.5, 0.0, 1.0)[:, :, np.newaxis]
+        region = self._pixels[top:bottom, left:right]
+        region[:] = np.rint(region * (1.0 - alpha) + np.asarray(fill[:3], dtype=np.float64) * alpha).astype(np.uint8)
+
+    def glow(self, radius: int = 79):
+        # Same sigma OpenCV derives from a kernel size, approximated by three
+        # box blurs per axis.
+        sigma = ksize_sigma(radius)
+        pixels = self._pixels
+        # Blur, add and saturate in a reused float buffer, then write back
+        blurred = _scratch_view('blurred', pixels.shape)
+        np.copyto(blurred, pixels)
+        for width in _box_sizes(sigma):
+            _box_blur(blurred, width, axis=1)
+            _box_blur(blurred, width, axis=0)
+        np.rint(blurred, out=blurred)
+        blurred += pixels
+        np.minimum(blurred, 255, out=blurred)
+        np.copyto(pixels, blurred, casting='unsafe')
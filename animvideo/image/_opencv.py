@@ -1,8 +1,46 @@
 import cv2
 import numpy as np
-from animvideo.image._img import Img
+from animvideo.image._img import Img, FrameBuffer
+from animvideo.image._sprites import RingSpriteCache, clip_sprite
+import animvideo.image._config as config
+import animvideo.image._glow as _glow
 import math
 
+# cv2.blendLinear() divides by the sum of the weights plus 1e-5, which
+# turns exact results like 241 into 240.99998 and then 240 unless the
+# weights are large.
+_BLEND_WEIGHT = 65536.0
+
+def _make_mask(coverage: np.ndarray):
+    # The weights of the ring's color and of the canvas, and a patch to
+    # fill with the color
+    colored = np.empty(coverage.shape + (3,), dtype=np.uint8)
+    return (coverage * _BLEND_WEIGHT, (1.0 - coverage) * _BLEND_WEIGHT, colored), coverage.nbytes * 2 + colored.nbytes
+
+def _stamp(image: np.ndarray, sprite: tuple[np.ndarray, np.ndarray, np.ndarray], color_bgr, x0: int, y0: int):
+    alpha, inverse, colored = sprite
+    clipped = clip_sprite(x0, y0, alpha.shape[0], image.shape[1], image.shape[0])
+    if clipped is None:
+        return
+    canvas, sprite = clipped
+    colored = colored[sprite]
+    colored[:] = color_bgr
+    # Blends in place, rounding like the NumPy backend
+    region = image[canvas]
+    cv2.blendLinear(region, colored, inverse[sprite], alpha[sprite], dst=region)
+
+def _circle_band(inner_radius: np.ndarray, outer_radius: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the inner and outer radii of the bands cv2.circle() fills for
+    rings drawn by ring(). Thick lines are drawn with a pen of radius
+    (thickness + 1) // 2 around the adjusted radius, so the band is wider
+    than outer_radius - inner_radius.
+    """
+    thickness = outer_radius - inner_radius
+    radius = np.where(thickness > 1, outer_radius - thickness // 2, outer_radius)
+    half = np.where(thickness > 1, (thickness + 1) // 2 + 0.5, 0.5)
+    return radius - half, radius + half
+
 class _OpenCVImage(Img):
     def __init__(self, image: cv2.typing.MatLike):
         self._image = image
@@ -13,6 +51,14 @@ class _OpenCVImage(Img):
         img[:] = color
         return cls(img)
 
+    @classmethod
+    def frombytes(cls, size: tuple[int, int], data: bytes) -> Img:
+        frame_rgb = np.frombuffer(data, dtype=np.uint8).reshape((size[1], size[0], 3))
+        return cls(cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR))
+
+    def clear(self, color: tuple[int, int, int] = (0, 0, 0)):
+        self._image[:] = color[::-1]
+
     def save(self, filename: str):
         cv2.imwrite(filename, self._image)
 
@@ -26,6 +72,10 @@ class _OpenCVImage(Img):
             raise ValueError("Unsupported NumPy array format. Expected 3-channel BGR.")
 
 
+    def as_buffer(self) -> FrameBuffer:
+        image = np.ascontiguousarray(self._image)
+        return FrameBuffer(memoryview(image.reshape(-1)), 'bgr24')
+
     @property
     def size(self) -> tuple[int, int]:
         flipped = self._image.shape[:2]
@@ -41,11 +91,45 @@ class _OpenCVImage(Img):
             sine = math.sin(rotation)
             cosine = math.cos(rotation)
             center = (center[0] * cosine - center[1] * sine, center[0] * sine + center[1] * cosine)
-            center = (int(center[0] + offset[0]), int(center[1] + offset[1]))
+            center = (center[0] + offset[0], center[1] + offset[1])
+        cache = config._ring_sprite_cache
+        if cache is not None:
+            self._stamp_ring(cache, color_bgr, inner_radius, outer_radius, center[0], center[1])
+            return
+        center = (int(center[0]), int(center[1]))
         thickness = outer_radius - inner_radius
         adjusted_radius = outer_radius - thickness // 2 if thickness > 1 else outer_radius
         cv2.circle(self._image, center, adjusted_radius, color_bgr, thickness)
 
+    def rings(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        cache = config._ring_sprite_cache
+        if cache is not None:
+            bands = np.column_stack(_circle_band(radii[:, 0], radii[:, 1]))
+            xs, ys, sprites = cache.sprites(centers, bands, _make_mask, origin)
+            image = self._image
+            # Colors are rounded as cv2.circle() rounds them
+            for x0, y0, sprite, color_bgr in zip(xs, ys, sprites, np.rint(colors[:, ::-1]).tolist()):
+                _stamp(image, sprite, color_bgr, x0, y0)
+            return
+        # Same truncation and thickness rules as ring(), for all rings at once.
+        # Truncate before moving to the origin, as on the full canvas.
+        centers = (centers.astype(np.int64) - np.asarray(origin, dtype=np.int64)).tolist()
+        thickness = radii[:, 1] - radii[:, 0]
+        adjusted_radii = np.where(thickness > 1, radii[:, 1] - thickness // 2, radii[:, 1]).tolist()
+        colors_bgr = colors[:, ::-1].tolist()
+        image = self._image
+        circle = cv2.circle
+        for center, adjusted_radius, color_bgr, ring_thickness in zip(centers, adjusted_radii, colors_bgr, thickness.tolist()):
+            circle(image, center, adjusted_radius, color_bgr, ring_thickness)
+
+    def _stamp_ring(self, cache: RingSpriteCache, color_bgr, inner_radius: int, outer_radius: int, center_x: float, center_y: float,
+                    origin: tuple[int, int] = (0, 0)):
+        # Only the mask is cached, the color is blended in here. The mask
+        # covers the band cv2.circle() would fill, so rings keep their width.
+        band_inner, band_outer = (float(radius) for radius in _circle_band(inner_radius, outer_radius))
+        x0, y0, sprite = cache.sprite(band_inner, band_outer, center_x, center_y, _make_mask)
+        _stamp(self._image, sprite, [round(channel) for channel in color_bgr], x0 - origin[0], y0 - origin[1])
+
     def ellipse(self, bbox: tuple[int, int, int, int], fill: tuple[int, int, int]|tuple[int, int, int, int] = (0, 0, 0)):
         # 1. Convert Pillow's bounding box to OpenCV's center and axes
         x0, y0, x1, y1 = bbox
@@ -62,5 +146,4 @@ class _OpenCVImage(Img):
             cv2.ellipse(self._image, center, axes, 0, 0, 360, color_bgr, thickness=-1)
 
     def glow(self, radius: int = 79):
-        blur_image = cv2.GaussianBlur(self._image, (radius, radius), 0)
-        self._image = cv2.add(self._image, blur_image)
+        _glow.glow(self._image, _glow.ksize_sigma(radius), ksize=radius)
@@ -1,4 +1,5 @@
-from animvideo.image._img import Img
+from animvideo.image._img import Img, FrameBuffer
+from animvideo.image._mesh import ring_mesh, ring_segments
 from panda3d.core import (
     loadPrcFileData,
     GraphicsOutput,
@@ -15,10 +16,12 @@ from panda3d.core import (
     GeomNode,
     OrthographicLens,
     Texture,
-    GeomTristrips, GeomVertexRewriter, ColorAttrib,
+    TransformState, RenderState,
 )
 from direct.showbase.ShowBase import ShowBase
+import cv2
 import math
+import numpy as np
 
 # Avoid writing a log file
 loadPrcFileData("", "notify-output /dev/null")
@@ -34,10 +37,17 @@ def get_base():
         base = ShowBase()
     return base
 
-class _Panda3dImage(Img):
-    def __init__(self, size, color):
-        self._size = size
-
+class _RenderTarget:
+    """
+    An offscreen buffer with its texture, and a lit scene seen through an
+    orthographic camera whose coordinates match pixel coordinates.
+
+    Creating a buffer is expensive, so images take targets from a pool
+    keyed by size and give them back when destroyed. Targets in the pool
+    are inactive, so they aren't rendered along with the images in use.
+    """
+    def __init__(self, size: tuple[int, int]):
+        self.size = size
         base = get_base()
 
         win_props = WindowProperties.size(size[0], size[1])
@@ -45,90 +55,144 @@ class _Panda3dImage(Img):
         fb_props.set_rgba_bits(8, 8, 8, 0)
         fb_props.set_depth_bits(24)
 
-        self._buffer = base.graphicsEngine.make_output(
+        self.buffer = base.graphicsEngine.make_output(
             base.pipe, "offscreen buffer", -2,
             fb_props, win_props,
             GraphicsPipe.BF_refuse_window,
         )
         tex = Texture()
-        tex.setup_2d_texture(self._size[0], self._size[1], Texture.T_unsigned_byte, Texture.F_rgb8)
-        self._buffer.add_render_texture(tex, GraphicsOutput.RTMCopyRam)
-        self._tex = tex
+        tex.setup_2d_texture(size[0], size[1], Texture.T_unsigned_byte, Texture.F_rgb8)
+        self.buffer.add_render_texture(tex, GraphicsOutput.RTMCopyRam)
+        self.tex = tex
 
-        r, g, b = color
-        self._buffer.set_clear_color(Vec4(r/255.0, g/255.0, b/255.0, 1.0))
-
-        self._scene = NodePath("scene")
-        self._camera = base.make_camera(self._buffer)
-        self._camera.reparent_to(self._scene)
+        self.scene = NodePath("scene")
+        self.camera = base.make_camera(self.buffer)
+        self.camera.reparent_to(self.scene)
 
         lens = OrthographicLens()
         lens.set_film_size(size[0], size[1])
         lens.set_near_far(-10, 10)
-        self._camera.node().set_lens(lens)
+        self.camera.node().set_lens(lens)
         # Position the camera so that the scene coordinates match pixel coordinates
-        self._camera.set_pos(size[0]/2, size[1]/2, 1)
-        self._camera.set_hpr(0, -90, 0)
+        self.camera.set_pos(size[0]/2, size[1]/2, 1)
+        self.camera.set_hpr(0, -90, 0)
 
         ambient_light = AmbientLight("ambient light")
         ambient_light.set_color(VBase4(1.0, 1.0, 1.0, 1.0)) # A dim gray light
-        ambient_lnp = self._scene.attach_new_node(ambient_light)
+        self.light = self.scene.attach_new_node(ambient_light)
 
         # Tell the scene to be illuminated by this light
-        self._scene.set_light(ambient_lnp)
-
-
-        def _make_ring_proto(segments=8):
-            fmt = GeomVertexFormat.get_v3()  # no per-vertex colors; we'll set color per-instance
-            vdata = GeomVertexData('unit_ring', fmt, Geom.UH_static)
-            vdata.set_num_rows((segments + 1) * 2)
+        self.scene.set_light(self.light)
 
-            vw = GeomVertexWriter(vdata, 'vertex')
-            # Unit ring with outer=1, inner=k kept in X-Y plane
-            k = 0.5  # default thickness; will be overridden via nonuniform scale if needed
-            for i in range(segments + 1):
-                t = (i / segments) * 2.0 * math.pi
-                c = math.cos(t); s = math.sin(t)
-                vw.add_data3(k*c, k*s, 0)  # inner
-                vw.add_data3(c, s, 0)      # outer
+        # What images draw, swapped out as a whole by reset()
+        self.content = self.scene.attach_new_node("content")
 
-            prim = GeomTristrips(Geom.UH_static)
-            prim.add_next_vertices((segments + 1) * 2)
-            prim.close_primitive()
+    def reset(self, color: tuple[int, int, int]):
+        """
+        Drops everything drawn so far, keeping the camera and light, sets
+        the background color and makes the buffer render again.
+        """
+        self.content.remove_node()
+        self.content = self.scene.attach_new_node("content")
+        # ShowBase frees the states of removed nodes from its task loop,
+        # which never runs here
+        TransformState.garbage_collect()
+        RenderState.garbage_collect()
+        r, g, b = color
+        self.buffer.set_clear_color(Vec4(r/255.0, g/255.0, b/255.0, 1.0))
+        self.buffer.set_active(True)
 
-            geom = Geom(vdata); geom.add_primitive(prim)
-            node = GeomNode('ring_proto'); node.add_geom(geom)
-            return node
+    def release(self):
+        """
+        Removes the graphics buffer and the scene.
+        """
+        base = get_base()
+        base.graphicsEngine.remove_window(self.buffer)
+        self.scene.remove_node()
+
+# Idle render targets by size, and how many of each size to keep.
+_free_targets: dict[tuple[int, int], list[_RenderTarget]] = {}
+_MAX_FREE_TARGETS = 2
+
+def _acquire_target(size: tuple[int, int], color: tuple[int, int, int]) -> _RenderTarget:
+    free = _free_targets.get(size)
+    target = free.pop() if free else _RenderTarget(size)
+    target.reset(color)
+    return target
+
+def _release_target(target: _RenderTarget):
+    free = _free_targets.setdefault(target.size, [])
+    if len(free) >= _MAX_FREE_TARGETS:
+        target.release()
+        return
+    # The scene is cleared when the target is next acquired
+    target.buffer.set_active(False)
+    free.append(target)
 
-        self._ring_proto = NodePath(_make_ring_proto())
+class _Panda3dImage(Img):
+    def __init__(self, size, color):
+        self._size = size
+        # Set when the texture holds pixels loaded by frombytes() rather
+        # than the result of rendering the scene.
+        self._static = False
 
+        self._target = _acquire_target(size, color)
+        self._buffer = self._target.buffer
+        self._tex = self._target.tex
+        self._scene = self._target.content
+        self._camera = self._target.camera
 
     @classmethod
     def empty(cls, size: tuple[int, int], color: tuple[int, int, int] = (0, 0, 0)) -> 'Img':
         return _Panda3dImage(size, color)
 
+    @classmethod
+    def frombytes(cls, size: tuple[int, int], data: bytes) -> 'Img':
+        image = _Panda3dImage(size, (0, 0, 0))
+        # Textures are stored bottom row first
+        rows = np.frombuffer(data, dtype=np.uint8).reshape((size[1], size[0] * 3))
+        # A texture that hasn't been rendered to yet may be padded to a
+        # power of two
+        image._tex.setup_2d_texture(size[0], size[1], Texture.T_unsigned_byte, Texture.F_rgb8)
+        image._tex.set_ram_image_as(rows[::-1].tobytes(), "RGB")
+        image._static = True
+        # Don't let other images' renders overwrite the loaded pixels
+        image._buffer.set_active(False)
+        return image
+
+    def clear(self, color: tuple[int, int, int] = (0, 0, 0)):
+        self._target.reset(color)
+        self._scene = self._target.content
+        self._static = False
+
     def save(self, filename: str):
         if not self._buffer:
             # Already destroyed
             return
+        if self._static:
+            self._tex.write(filename)
+            return
         base = get_base()
         base.graphicsEngine.render_frame()
         self._buffer.save_screenshot(filename)
 
     def tobytes(self) -> bytes:
-        base = get_base()
-        base.graphicsEngine.render_frame()
-        img = self._tex.get_ram_image_as("RGB")
+        # The texture is BGR, bottom row first. OpenCV swaps the channels of
+        # the flipped view much faster than NumPy copies it with reversed
+        # channels.
+        w, h = self._size
+        data = np.frombuffer(self.as_buffer().data, dtype=np.uint8).reshape((h, w, 3))
+        return cv2.cvtColor(data[::-1], cv2.COLOR_BGR2RGB).tobytes()
+
+    def as_buffer(self) -> FrameBuffer:
+        if not self._static:
+            base = get_base()
+            base.graphicsEngine.render_frame()
+        img = self._tex.get_ram_image()
         if not img:
             raise RuntimeError("Texture has no RAM image")
-        data = bytes(img)
-
-        # Flip vertically to match conventional top-to-bottom rows
-        w, h = self._size
-        row_bytes = w * 3
-        return b''.join(
-            data[y*row_bytes:(y+1)*row_bytes] for y in reversed(range(h))
-        )
+        # Panda3D keeps RGB textures as BGR, bottom row first
+        return FrameBuffer(memoryview(img), 'bgr24', bottom_up=True)
 
     @property
     def size(self) -> tuple[int, int]:
@@ -146,19 +210,17 @@ class _Panda3dImage(Img):
         px = cx_img + rx
         py = cy_img + ry
 
-        inst = self._ring_proto.copy_to(self._scene)
-        # Uniform scale by outer radius; then shrink inner radius via nonuniform XY scale
-        # Base proto has inner/outer = k/1. To get desired inner_radius, set k = inner/outer.
-        k = 0.0 if outer_radius == 0 else (inner_radius / max(outer_radius, 1e-6))
-        inst.set_pos(px, py, 0)
-        #inst.set_hpr(math.degrees(rotation), 0, 0)  # rotate in-plane (about Z)
-        inst.set_scale(outer_radius, outer_radius, 1)
-        # Adjust proto’s built-in k by additional nonuniform scale of inner vertices via TexMatrix is not available,
-        # so rebuild once per distinct k buckets or keep two protos. Easiest: make one proto per k.
-        inst.set_color(color[0]/255.0, color[1]/255.0, color[2]/255.0, 1.0)
-        #inst.set_attrib(ColorAttrib.make_vertex())  # ensure per-instance color modulates
-
+        self._scene.attach_new_node(ring_mesh('ring', np.array([[px, py]]), np.array([outer_radius]), np.array([color]),
+                                              ring_segments(outer_radius)))
 
+    def rings(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        # Centers are already rotated, so all rings go into one mesh
+        if len(centers) == 0:
+            return
+        if origin != (0, 0):
+            centers = centers - np.asarray(origin, dtype=np.float64)
+        outer_radii = radii[:, 1]
+        self._scene.attach_new_node(ring_mesh('rings', centers, outer_radii, colors, ring_segments(float(outer_radii.max()))))
 
     def ellipse(self, bbox: tuple[int, int, int, int], fill: tuple[int, int, int] = (0, 0, 0)):
         x0, y0, x1, y1 = bbox
@@ -203,23 +265,17 @@ class _Panda3dImage(Img):
 
     def destroy(self):
         """
-        Explicitly releases Panda3D and GPU resources used by this instance.
+        Hands the render target back to the pool, or releases its Panda3D
+        and GPU resources if the pool has enough of this size.
         """
         if self._buffer is None:
             # Already destroyed
             return
 
-        base = get_base()
-
-        # 1. Most importantly, remove the graphics buffer
-        base.graphicsEngine.remove_window(self._buffer)
-
-        # 2. Clean up the scene graph and camera
-        self._scene.remove_node()
+        _release_target(self._target)
 
-        # 3. Clear references to help the garbage collector
+        # Clear references so the image can't draw into a reused target
+        self._target = None
         self._buffer = None
         self._scene = None
         self._camera = None
-        self._vdata = None # From the refactored code
-        self._prim = None  # From the refactored code
@@ -1,6 +1,14 @@
 from animvideo.image._img import Img
 from PIL import Image, ImageDraw, ImageFilter, ImageChops
 import math
+import numpy as np
+import animvideo.image._config as config
+import animvideo.image._glow as _glow
+from animvideo.image._sprites import RingSpriteCache
+
+def _make_mask(coverage: np.ndarray):
+    mask = Image.fromarray(np.rint(coverage * 255).astype(np.uint8), 'L')
+    return mask, coverage.size
 
 class _PillowImage(Img):
     def __init__(self, image: Image.Image):
@@ -11,6 +19,13 @@ class _PillowImage(Img):
     def empty(cls, size: tuple[int, int], color: tuple[int, int, int] = (0, 0, 0)) -> 'Img':
         return cls(Image.new('RGB', size, color))
 
+    @classmethod
+    def frombytes(cls, size: tuple[int, int], data: bytes) -> 'Img':
+        return cls(Image.frombytes('RGB', size, data))
+
+    def clear(self, color: tuple[int, int, int] = (0, 0, 0)):
+        self._image.paste(tuple(color), (0, 0, *self._image.size))
+
     def save(self, filename: str):
         self._image.save(filename, compress_level=1)
 
@@ -32,6 +47,10 @@ class _PillowImage(Img):
             center = (center[0] * cosine - center[1] * sine, center[0] * sine + center[1] * cosine)
             center = (center[0] + offset[0], center[1] + offset[1])
         center_x, center_y = center
+        cache = config._ring_sprite_cache
+        if cache is not None:
+            self._stamp_ring(cache, color, inner_radius, outer_radius, center_x, center_y)
+            return
 
         # Calculate the bounding boxes for the inner and outer circles
         outer_bbox = (
@@ -53,10 +72,50 @@ class _PillowImage(Img):
         # Draw the inner circle with a transparent fill to create the hole
         self._draw.ellipse(inner_bbox, fill=(0, 0, 0))
 
+    def rings(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        colors = colors.astype(np.int64).tolist()
+        cache = config._ring_sprite_cache
+        if cache is not None:
+            xs, ys, masks = cache.sprites(centers, radii, _make_mask, origin)
+            paste = self._image.paste
+            for x, y, mask, color in zip(xs, ys, masks, colors):
+                paste(tuple(color), (x, y), mask)
+            return
+        if origin != (0, 0) and len(centers):
+            # Pillow rasterizes ellipses that start at negative coordinates
+            # differently, so draw with a margin that keeps each ellipse on
+            # the same side of zero as on the full canvas
+            reach = 2 * int(radii.max()) + 2
+            margin = (min(origin[0], reach), min(origin[1], reach))
+            canvas = Image.new('RGB', (self._image.width + margin[0], self._image.height + margin[1]))
+            canvas.paste(self._image, margin)
+            self._draw_rings(ImageDraw.Draw(canvas), centers - np.asarray(origin, dtype=np.float64) + margin, radii, colors)
+            self._image = canvas.crop((margin[0], margin[1], canvas.width, canvas.height))
+            self._draw = ImageDraw.Draw(self._image)
+            return
+        self._draw_rings(self._draw, centers, radii, colors)
+
+    @staticmethod
+    def _draw_rings(draw: ImageDraw.ImageDraw, centers: np.ndarray, radii: np.ndarray, colors: list):
+        ellipse = draw.ellipse
+        for (center_x, center_y), (inner_radius, outer_radius), color in zip(centers.tolist(), radii.tolist(), colors):
+            ellipse((center_x - outer_radius, center_y - outer_radius, center_x + outer_radius, center_y + outer_radius), fill=tuple(color))
+            ellipse((center_x - inner_radius, center_y - inner_radius, center_x + inner_radius, center_y + inner_radius), fill=(0, 0, 0))
+
+    def _stamp_ring(self, cache: RingSpriteCache, color, inner_radius: int, outer_radius: int, center_x: float, center_y: float,
+                    origin: tuple[int, int] = (0, 0)):
+        # Only the mask is cached, paste() fills it with the color
+        x0, y0, mask = cache.sprite(inner_radius, outer_radius, center_x, center_y, _make_mask)
+        self._image.paste((int(color[0]), int(color[1]), int(color[2])), (x0 - origin[0], y0 - origin[1]), mask)
+
     def ellipse(self, bbox: tuple[int, int, int, int], fill: tuple[int, int, int] = (0, 0, 0)):
         self._draw.ellipse(bbox, fill=fill)
 
     def glow(self, radius: int = 79):
-        blur_image = self._image.filter(ImageFilter.GaussianBlur(radius=radius))
-        self._image = ImageChops.add(self._image, blur_image)
+        if config._glow_engine == 'pyramid':
+            # Pillow's blur radius is the standard deviation
+            self._image = Image.fromarray(_glow.glow(np.array(self._image), radius, engine='pyramid'))
+        else:
+            blur_image = self._image.filter(ImageFilter.GaussianBlur(radius=radius))
+            self._image = ImageChops.add(self._image, blur_image)
         self._draw = ImageDraw.Draw(self._image)
@@ -0,0 +1,58 @@
+from typing import Type
+from animvideo.image._img import Img
+
+class ImagePool:
+    """
+    Keeps released images around to hand out again, so a long render reuses
+    a fixed set of canvases instead of allocating and freeing one per frame.
+
+    Images are matched by backend and size and cleared before they are
+    reused. Only kinds of images that have been acquired are kept, so images
+    that came from elsewhere, like frames decoded from render workers, don't
+    sit in the pool. At most max_images are kept, the least recently
+    released are destroyed first.
+    """
+    def __init__(self, max_images: int = 2):
+        self.max_images = max_images
+        self.hits = 0
+        self.misses = 0
+        self._free: list[Img] = []
+        self._acquired: set[tuple[Type[Img], tuple[int, int]]] = set()
+
+    def acquire(self, cls: Type[Img], size: tuple[int, int], color: tuple[int, int, int] = (0, 0, 0)) -> Img:
+        """
+        Returns an image of the given backend and size filled with color.
+        """
+        for index in range(len(self._free) - 1, -1, -1):
+            image = self._free[index]
+            if type(image) is cls and image.size == size:
+                del self._free[index]
+                self.hits += 1
+                image.clear(color)
+                return image
+        self.misses += 1
+        self._acquired.add((cls, size))
+        return cls.empty(size, color)
+
+    def release(self, image: Img):
+        """
+        Takes back an image the caller is done with.
+        """
+        if (type(image), image.size) not in self._acquired:
+            image.destroy()
+            return
+        self._free.append(image)
+        if len(self._free) > self.max_images:
+            self._free.pop(0).destroy()
+
+    def destroy(self):
+        for image in self._free:
+            image.destroy()
+        self._free.clear()
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -1,8 +1,27 @@
-from animvideo.image._img import Img
+from animvideo.image._img import Img, FrameBuffer
 import pygame
-import cv2
+import numpy as np
 import math
+import sys
 import animvideo.image._config as config
+import animvideo.image._glow as _glow
+from animvideo.image._sprites import RingSpriteCache
+
+def _make_sprite(coverage: np.ndarray):
+    # A white mask, and a surface of the same size to color it in
+    mask = pygame.Surface(coverage.shape[::-1], pygame.SRCALPHA)
+    mask.fill((255, 255, 255))
+    # surfarray is indexed (x, y)
+    pygame.surfarray.pixels_alpha(mask)[:] = np.rint(coverage.T * 255).astype(np.uint8)
+    return (mask, pygame.Surface(mask.get_size(), pygame.SRCALPHA)), coverage.size * 8
+
+def _stamp(surface: pygame.Surface, sprite: tuple[pygame.Surface, pygame.Surface], color, position: tuple[int, int]):
+    # Multiplying the mask into the solid color gives exactly the color
+    # with the mask's alpha, which blit() then blends in.
+    mask, colored = sprite
+    colored.fill(color)
+    colored.blit(mask, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+    surface.blit(colored, position)
 
 class _PygameImage(Img):
     def __init__(self, surface: pygame.Surface):
@@ -14,12 +33,33 @@ class _PygameImage(Img):
         surface.fill(color)
         return _PygameImage(surface)
 
+    @classmethod
+    def frombytes(cls, size: tuple[int, int], data: bytes) -> 'Img':
+        return _PygameImage(pygame.image.fromstring(data, size, 'RGB'))
+
+    def clear(self, color: tuple[int, int, int] = (0, 0, 0)):
+        self._surface.fill(color)
+
     def save(self, filename: str):
         pygame.image.save(self._surface, filename)
 
     def tobytes(self) -> bytes:
         return pygame.image.tostring(self._surface, 'RGB')
 
+    def as_buffer(self) -> FrameBuffer:
+        surface = self._surface
+        bytesize = surface.get_bytesize()
+        if bytesize not in (3, 4) or surface.get_pitch() != surface.get_width() * bytesize:
+            # Rows are padded, the pixels can't be passed on as they are
+            return super().as_buffer()
+        # Name the bytes of a pixel in memory order, FFmpeg style
+        names = ['0'] * bytesize
+        for name, shift in zip('rgb', surface.get_shifts()):
+            index = shift // 8 if sys.byteorder == 'little' else bytesize - 1 - shift // 8
+            names[index] = name
+        pix_fmt = ''.join(names) + ('24' if bytesize == 3 else '')
+        return FrameBuffer(memoryview(surface.get_buffer()), pix_fmt)
+
     @property
     def size(self) -> tuple[int, int]:
         return self._surface.get_size()
@@ -32,10 +72,46 @@ class _PygameImage(Img):
             sine = math.sin(rotation)
             cosine = math.cos(rotation)
             center = (center[0] * cosine - center[1] * sine, center[0] * sine + center[1] * cosine)
-            center = (int(center[0] + offset[0]), int(center[1] + offset[1]))
+            center = (center[0] + offset[0], center[1] + offset[1])
+        cache = config._ring_sprite_cache
+        if cache is not None:
+            self._stamp_ring(cache, color, inner_radius, outer_radius, center[0], center[1])
+            return
+        center = (int(center[0]), int(center[1]))
         pygame.draw.circle(self._surface, color, center, outer_radius)
         pygame.draw.circle(self._surface, (0, 0, 0), center, inner_radius)
 
+    def rings(self, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray, origin: tuple[int, int] = (0, 0)):
+        cache = config._ring_sprite_cache
+        if cache is not None:
+            xs, ys, sprites = cache.sprites(centers, radii, _make_sprite, origin)
+            colors = np.column_stack([colors.astype(np.int64), np.full(len(colors), 255)]).tolist()
+            # _stamp() inlined, this loop runs once per ring
+            blit = self._surface.blit
+            multiply = pygame.BLEND_RGBA_MULT
+            for x, y, (mask, colored), color in zip(xs, ys, sprites, colors):
+                colored.fill(color)
+                colored.blit(mask, (0, 0), special_flags=multiply)
+                blit(colored, (x, y))
+            return
+        # Same truncation as ring(), for all rings at once. Truncate before
+        # moving to the origin, as on the full canvas.
+        centers = (centers.astype(np.int64) - np.asarray(origin, dtype=np.int64)).tolist()
+        surface = self._surface
+        circle = pygame.draw.circle
+        # Lock once instead of once per circle
+        surface.lock()
+        try:
+            for center, (inner_radius, outer_radius), color in zip(centers, radii.tolist(), colors.tolist()):
+                circle(surface, color, center, outer_radius)
+                circle(surface, (0, 0, 0), center, inner_radius)
+        finally:
+            surface.unlock()
+
+    def _stamp_ring(self, cache: RingSpriteCache, color, inner_radius: int, outer_radius: int, center_x: float, center_y: float,
+                    origin: tuple[int, int] = (0, 0)):
+        x0, y0, sprite = cache.sprite(inner_radius, outer_radius, center_x, center_y, _make_sprite)
+        _stamp(self._surface, sprite, (int(color[0]), int(color[1]), int(color[2]), 255), (x0 - origin[0], y0 - origin[1]))
 
     def ellipse(self, bbox: tuple[int, int, int, int], fill: tuple[int, int, int] = (0, 0, 0)):
         pygame.draw.ellipse(self._surface, fill, bbox)
@@ -44,34 +120,38 @@ class _PygameImage(Img):
         if config._use_opencv_for_glow:
             self._opencv_glow(radius=radius)
         else:
-            self._pygame_glow()
+            self._pygame_glow(radius=radius)
 
-    def _pygame_glow(self):
-        size = self.size
-        scale_factor = 4
-        small_size = (max(1, size[0] // scale_factor), max(1, size[1] // scale_factor))
-        small_surface = pygame.transform.smoothscale(self._surface, small_size)
-        blur_surface = pygame.transform.smoothscale(small_surface, size)
-        self._surface.blit(blur_surface, (0, 0), special_flags=pygame.BLEND_RGB_ADD)
+    def _pygame_glow(self, radius: int = 79):
+        # Always approximate, much faster than the full Gaussian and closer
+        # to it than scaling down and back up with smoothscale.
+        self._glow_pixels(radius, engine='pyramid')
 
     def _opencv_glow(self, radius: int = 79):
+        self._glow_pixels(radius, engine=None)
+
+    def _glow_pixels(self, radius: int, engine: str | None):
+        surface = self._surface
+        if surface.get_bytesize() == 4 and surface.get_pitch() == surface.get_width() * 4:
+            # Blur the surface's own BGRX pixels in place. The padding byte
+            # is blurred too, but nothing reads it.
+            width, height = surface.get_size()
+            pixels = np.asarray(surface.get_view('2')).T.view(np.uint8).reshape((height, width, 4))
+            _glow.glow(pixels, _glow.ksize_sigma(radius), ksize=radius, engine=engine)
+            del pixels
+            return
+
         # 1. Get a NumPy array view of the PyGame surface's pixels
         # This is a view, not a copy, so it's fast!
         numpy_view = pygame.surfarray.pixels3d(self._surface)
 
         # 2. Transpose the axes from (width, height, RGB) to (height, width, RGB)
-        # This is the format OpenCV expects.
-        opencv_image_rgb = numpy_view.transpose([1, 0, 2])
-
-        # 3. Convert the color order from RGB (PyGame) to BGR (OpenCV)
-        opencv_image_bgr = cv2.cvtColor(opencv_image_rgb, cv2.COLOR_RGB2BGR)
-
-        # 4. Apply the Gaussian Blur using OpenCV
-        # The (51, 51) kernel size determines the blur intensity. It must be an odd number.
-        blurred_bgr = cv2.GaussianBlur(opencv_image_bgr, (radius, radius), 0)
-        blurred_bgr = cv2.add(blurred_bgr, opencv_image_bgr)
+        # This is the format OpenCV expects. The blur treats channels
+        # independently, so there's no need to convert to BGR.
+        opencv_image_rgb = np.ascontiguousarray(numpy_view.transpose([1, 0, 2]))
+        del numpy_view
 
-        # 5. Convert the color order back from BGR to RGB
-        blurred_rgb = cv2.cvtColor(blurred_bgr, cv2.COLOR_BGR2RGB)
+        # 3. Blur and add with the shared glow engine
+        glowed_rgb = _glow.glow(opencv_image_rgb, _glow.ksize_sigma(radius), ksize=radius, engine=engine)
 
-        pygame.surfarray.blit_array(self._surface, blurred_rgb.transpose([1, 0, 2]))
+        pygame.surfarray.blit_array(self._surface, glowed_rgb.transpose([1, 0, 2]))
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+from animvideo.image._coverage import annulus_coverage
+import numpy as np
+import math
+
+class RingSpriteCache:
+    """
+    A bounded LRU cache of pre-rasterized rings.
+
+    Every ring drawn at a given scale has the same radii, so instead of
+    rasterizing each one from scratch the backends rasterize an
+    anti-aliased coverage mask once per (radii, sub-pixel offset) and blend
+    the ring's color through it into place. Sub-pixel offsets are bucketed
+    into `subpixel` steps per axis, so all rings of a scale share
+    subpixel**2 entries. Colors are nearly unique per ring, which is why
+    they are not part of the key.
+
+    What a sprite is depends on the backend, which passes a factory that
+    turns a coverage mask into a sprite and its size in bytes.
+    """
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, subpixel: int = 4):
+        self.max_bytes = max_bytes
+        self.subpixel = subpixel
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+
+    def sprite(self, inner_radius: float, outer_radius: float, center_x: float, center_y: float,
+               make: Callable[[np.ndarray], tuple[Any, int]]) -> tuple[int, int, Any]:
+        """
+        Returns the sprite for a ring at the given center, along with the
+        canvas position of its top left corner. The radii may be fractional.
+
+        Args:
+            make: Called with the coverage mask on a miss. Returns the
+                sprite and the number of bytes it holds.
+        """
+        reach = math.ceil(outer_radius) + 1
+        base_x = math.floor(center_x)
+        base_y = math.floor(center_y)
+        bucket_x = min(int((center_x - base_x) * self.subpixel), self.subpixel - 1)
+        bucket_y = min(int((center_y - base_y) * self.subpixel), self.subpixel - 1)
+        return base_x - reach, base_y - reach, self._get((inner_radius, outer_radius, bucket_x, bucket_y), 1, make)
+
+    def sprites(self, centers: np.ndarray, radii: np.ndarray, make: Callable[[np.ndarray], tuple[Any, int]],
+                origin: tuple[int, int] = (0, 0)) -> tuple[list[int], list[int], list[Any]]:
+        """
+        Like sprite() for many rings at once: returns the x and y of each
+        ring's sprite relative to `origin`, and the sprites. Positions and
+        buckets are computed for all rings together and each distinct sprite
+        is looked up once, so drawing only has to loop over the stamps.
+
+        Args:
+            centers: (N, 2) ring centers on the canvas.
+            radii: (N, 2) inner and outer radii.
+        """
+        if len(centers) == 0:
+            return [], [], []
+        centers = np.asarray(centers, dtype=np.float64)
+        radii = np.asarray(radii, dtype=np.float64)
+        base = np.floor(centers)
+        buckets = np.minimum(((centers - base) * self.subpixel).astype(np.int64), self.subpixel - 1)
+        corners = base.astype(np.int64) - (np.ceil(radii[:, 1]).astype(np.int64) + 1)[:, np.newaxis] - np.asarray(origin, dtype=np.int64)
+        keys, inverse, counts = np.unique(np.column_stack([radii, buckets]), axis=0, return_inverse=True, return_counts=True)
+        entries = [self._get((inner_radius, outer_radius, int(bucket_x), int(bucket_y)), int(count), make)
+                   for (inner_radius, outer_radius, bucket_x, bucket_y), count in zip(keys.tolist(), counts.tolist())]
+        return corners[:, 0].tolist(), corners[:, 1].tolist(), [entries[index] for index in inverse.ravel().tolist()]
+
+    def _get(self, key: Hashable, uses: int, make: Callable[[np.ndarray], tuple[Any, int]]) -> Any:
+        """
+        Returns the sprite for `key`, making it on a miss, and counts `uses`
+        stamps of it: a miss for the first if it was made, hits for the rest.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            self.hits += uses - 1
+            inner_radius, outer_radius, bucket_x, bucket_y = key
+            entry = make(self._coverage(inner_radius, outer_radius, bucket_x, bucket_y))
+            self._entries[key] = entry
+            self._bytes += entry[1]
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, nbytes) = self._entries.popitem(last=False)
+                self._bytes -= nbytes
+                self.evictions += 1
+        else:
+            self.hits += uses
+            self._entries.move_to_end(key)
+        return entry[0]
+
+    def _coverage(self, inner_radius: float, outer_radius: float, bucket_x: int, bucket_y: int) -> np.ndarray:
+        reach = math.ceil(outer_radius) + 1
+        span = np.arange(2 * reach + 1, dtype=np.float64) - reach
+        # Rasterize at the middle of the bucket
+        dx = span - (bucket_x + 0.5) / self.subpixel
+        dy = span - (bucket_y + 0.5) / self.subpixel
+        return annulus_coverage(dx[np.newaxis, :], dy[:, np.newaxis], inner_radius, outer_radius).astype(np.float32)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+        }
+
+def clip_sprite(x0: int, y0: int, side: int, width: int, height: int) -> tuple[tuple[slice, slice], tuple[slice, slice]] | None:
+    """
+    Clips a square sprite placed at (x0, y0) to a canvas. Returns the
+    (rows, columns) slices of the canvas and of the sprite that overlap, or
+    None if the sprite is entirely off the canvas.
+    """
+    left, top = max(x0, 0), max(y0, 0)
+    right, bottom = min(x0 + side, width), min(y0 + side, height)
+    if left >= right or top >= bottom:
+        return None
+    return ((slice(top, bottom), slice(left, right)),
+            (slice(top - y0, bottom - y0), slice(left - x0, right - x0)))
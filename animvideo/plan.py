@@ -0,0 +1,162 @@
+import math
+import numpy as np
+from dataclasses import dataclass
+from animvideo.config import Config
+
+def ncircles(disc_radius, radius):
+    return math.floor(math.pi / math.asin(radius / disc_radius))
+
+def visible_arcs(distance: float, half_width: float, half_height: float) -> np.ndarray:
+    """
+    Returns the angles at which a point at the given distance from the
+    center of a rectangle lies inside it, as an (N, 2) array of [start, end]
+    intervals within [0, 2*pi]. Angles are measured from the positive x
+    axis. Since the rectangle is symmetric, so is the result.
+    """
+    if distance <= min(half_width, half_height):
+        return np.array([[0.0, 2 * math.pi]])
+    # Angles closer than alpha to the x axis are beyond the sides, angles
+    # closer than beta to the y axis are beyond the top and bottom.
+    alpha = math.acos(min(half_width / distance, 1.0))
+    beta = math.acos(min(half_height / distance, 1.0))
+    if alpha >= math.pi / 2 - beta:
+        return np.empty((0, 2))
+    half_pi = math.pi / 2
+    return np.array([
+        [alpha, half_pi - beta],
+        [half_pi + beta, math.pi - alpha],
+        [math.pi + alpha, 3 * half_pi - beta],
+        [3 * half_pi + beta, 2 * math.pi - alpha],
+    ])
+
+@dataclass
+class RenderPlan:
+    """
+    Everything about the animation that doesn't change from frame to frame,
+    computed once from a Config.
+
+    Rings are stored as parallel arrays in drawing order. The plan is plain
+    data, so it can be pickled and sent to render workers as-is.
+    """
+    size: tuple[int, int]
+    # Level of each ring, starting at 1 for the innermost orbital.
+    levels: np.ndarray
+    # Angle of each ring at frame 0, in radians.
+    angles: np.ndarray
+    # Distance of each ring's center from the center of the canvas.
+    distances: np.ndarray
+    # RGB color of each ring, as floats.
+    colors: np.ndarray
+    # Inner and outer radius of each ring.
+    radii: np.ndarray
+    # Rotation of each level, in degrees per two frames. Indexed by level.
+    velocities: np.ndarray
+    # Rings of level l are levels_start[l] up to levels_start[l + 1].
+    level_starts: np.ndarray
+    # Per level, the angles from the canvas center at which a ring is at
+    # least partly on the canvas. See visible_arcs().
+    arcs: list[np.ndarray]
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'RenderPlan':
+        colors0 = config.COLORS0
+        colors1 = config.COLORS1
+        levels = []
+        angles = []
+        distances = []
+        colors = []
+        for level in range(1, config.LEVELS):
+            distance = level * config.OUTER_RADIUS * 2 + config.ADJUSTMENT
+            n = ncircles(distance, config.OUTER_RADIUS)
+            rotation_deg = 0.0
+            while rotation_deg < 360.0:
+                rotation = math.radians(rotation_deg)
+                rotprime = rotation * 6 % (2 * math.pi)
+                quadnum = int(rotation * 3 / (math.pi / 2))
+                cosine = abs(math.cos(rotprime))
+                if quadnum % 3 == 0:
+                    quadrant = colors0[level % len(colors0)]
+                else:
+                    quadrant = colors1[level % len(colors1)]
+                mult = 1 - math.pow(cosine, 2)
+
+                levels.append(level)
+                angles.append(rotation)
+                distances.append(distance)
+                colors.append((quadrant[0] * mult, quadrant[1] * mult, quadrant[2] * mult))
+                rotation_deg += 360.0 / n
+
+        radii = np.empty((len(levels), 2), dtype=np.int64)
+        radii[:] = (config.INNER_RADIUS, config.OUTER_RADIUS)
+        level_starts = np.searchsorted(np.array(levels, dtype=np.int64), np.arange(config.LEVELS + 1))
+        # Widen the canvas by a ring, plus a pixel for anti-aliasing and one
+        # to spare, so that culled rings can't touch it.
+        margin = config.OUTER_RADIUS + 2
+        half_width = config.CANVAS_SIZE[0] / 2 + margin
+        half_height = config.CANVAS_SIZE[1] / 2 + margin
+        arcs = [visible_arcs(level * config.OUTER_RADIUS * 2 + config.ADJUSTMENT, half_width, half_height)
+                for level in range(config.LEVELS)]
+        return cls(
+            size=config.CANVAS_SIZE,
+            levels=np.array(levels, dtype=np.int64),
+            angles=np.array(angles, dtype=np.float64),
+            distances=np.array(distances, dtype=np.float64),
+            colors=np.array(colors, dtype=np.float64).reshape((-1, 3)),
+            radii=radii,
+            velocities=1.0 - np.arange(config.LEVELS) / config.LEVELS,
+            level_starts=level_starts,
+            arcs=arcs,
+        )
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def centers(self, add_rot: int, indices: np.ndarray | None = None) -> np.ndarray:
+        """
+        Returns the (x, y) canvas position of every ring at the given frame,
+        or of the rings at the given indices, as an (N, 2) float array.
+        """
+        angles, levels, distances = self.angles, self.levels, self.distances
+        if indices is not None:
+            angles, levels, distances = angles[indices], levels[indices], distances[indices]
+        theta = angles + np.radians(add_rot / 2 * self.velocities[levels])
+        centers = np.empty((len(levels), 2), dtype=np.float64)
+        # Every ring starts to the left of the canvas center and is rotated
+        # about it.
+        centers[:, 0] = -distances * np.cos(theta) + self.size[0] // 2
+        centers[:, 1] = -distances * np.sin(theta) + self.size[1] // 2
+        return centers
+
+    def visible(self, add_rot: int) -> np.ndarray:
+        """
+        Returns the indices of the rings that are at least partly on the
+        canvas at the given frame, in drawing order.
+
+        Each level turns as a whole, so instead of testing every ring, the
+        level's visible arcs are turned back by the level's rotation and
+        looked up in its sorted starting angles.
+        """
+        two_pi = 2 * math.pi
+        parts = []
+        for level in range(1, len(self.arcs)):
+            start, end = int(self.level_starts[level]), int(self.level_starts[level + 1])
+            arcs = self.arcs[level]
+            if len(arcs) == 1 and arcs[0, 1] - arcs[0, 0] >= two_pi:
+                parts.append(np.arange(start, end))
+                continue
+            angles = self.angles[start:end]
+            # A ring at angle theta sits at theta + pi from the canvas center
+            shift = math.pi + math.radians(add_rot / 2 * self.velocities[level])
+            for arc_start, arc_end in arcs:
+                lower = (arc_start - shift) % two_pi
+                upper = lower + (arc_end - arc_start)
+                first = np.searchsorted(angles, lower, side='left')
+                last = np.searchsorted(angles, upper, side='right')
+                parts.append(np.arange(start + first, start + last))
+                if upper > two_pi:
+                    last = np.searchsorted(angles, upper - two_pi, side='right')
+                    parts.append(np.arange(start, start + last))
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        # Arcs that meet can both claim a ring on their shared edge
+        return np.unique(np.concatenate(parts))
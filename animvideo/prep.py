@@ -0,0 +1,124 @@
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from animvideo.image import FrameBuffer
+
+# OpenCV conversions to I420 for the pixel formats backends export. Other
+# formats are reordered to RGB first.
+_I420_CODES = {
+    'rgb24': cv2.COLOR_RGB2YUV_I420,
+    'bgr24': cv2.COLOR_BGR2YUV_I420,
+    'rgb0': cv2.COLOR_RGBA2YUV_I420,
+    'rgba': cv2.COLOR_RGBA2YUV_I420,
+    'bgr0': cv2.COLOR_BGRA2YUV_I420,
+    'bgra': cv2.COLOR_BGRA2YUV_I420,
+}
+
+class FramePrep:
+    """
+    Scales frames down to the output size with area averaging and converts
+    them to yuv420p (I420: the Y plane, then the quarter size U and V
+    planes), so FFmpeg gets output sized frames it can encode as they are.
+
+    Frames are processed in horizontal bands on `threads` threads. OpenCV's
+    resize and cvtColor release the GIL, so the bands run in parallel. Each
+    band covers an even number of output rows, which makes the result the
+    same as converting the whole frame at once.
+
+    Bands need the frame to be a whole multiple of the output size. Other
+    sizes are converted in one piece.
+    """
+    def __init__(self, size: Tuple[int, int], output_size: Tuple[int, int], threads: int = 4):
+        width, height = output_size
+        if width % 2 or height % 2:
+            raise ValueError(f"yuv420p needs an even output size, not {width}x{height}")
+        self.size = size
+        self.output_size = output_size
+        factor = size[0] // width
+        # Input rows per output row, or None if bands can't be cut exactly
+        self.factor: Optional[int] = factor if factor >= 1 and size == (width * factor, height * factor) else None
+        self.frame_bytes = width * height * 3 // 2
+        self.threads = max(threads, 1)
+        self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='frame-prep') if self.threads > 1 else None
+
+    @property
+    def rows_per_step(self) -> Optional[int]:
+        """
+        Input rows that make up a pair of output rows, the smallest piece
+        convert_rows() takes, or None if it can't be used.
+        """
+        return 2 * self.factor if self.factor is not None else None
+
+    def _planes(self, out) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        width, height = self.output_size
+        data = np.frombuffer(out, dtype=np.uint8, count=self.frame_bytes)
+        luma = width * height
+        return data[:luma], data[luma:luma + luma // 4], data[luma + luma // 4:]
+
+    def _convert(self, src: np.ndarray, pix_fmt: str, bottom_up: bool, top: int, bottom: int, planes: tuple[np.ndarray, np.ndarray, np.ndarray]):
+        # Converts input rows to output rows top to bottom of the frame
+        width = self.output_size[0]
+        if src.shape[:2] != (bottom - top, width):
+            src = cv2.resize(src, (width, bottom - top), interpolation=cv2.INTER_AREA)
+        if bottom_up:
+            src = cv2.flip(src, 0)
+        code = _I420_CODES.get(pix_fmt)
+        if code is None:
+            src = np.ascontiguousarray(src[:, :, [pix_fmt.index(channel) for channel in 'rgb']])
+            code = cv2.COLOR_RGB2YUV_I420
+        rows = bottom - top
+        yuv = cv2.cvtColor(src, code).reshape(-1)
+        # OpenCV takes the chroma of each 2x2 block from its top left pixel,
+        # which makes thin rings flicker in color. Converting blocks filled
+        # with their average color gives the averaged chroma instead.
+        half = cv2.resize(src, (width // 2, rows // 2), interpolation=cv2.INTER_AREA)
+        blocks = cv2.resize(half, (width, rows), interpolation=cv2.INTER_NEAREST)
+        averaged = cv2.cvtColor(blocks, code).reshape(-1)
+        y, u, v = planes
+        luma, chroma = rows * width, rows * width // 4
+        y[top * width:bottom * width] = yuv[:luma]
+        u[top * width // 4:bottom * width // 4] = averaged[luma:luma + chroma]
+        v[top * width // 4:bottom * width // 4] = averaged[luma + chroma:]
+
+    def convert(self, buffer: FrameBuffer, out):
+        """
+        Converts a whole exported frame into `out`, a writable buffer of at
+        least frame_bytes bytes.
+        """
+        width, height = self.size
+        pixels = np.frombuffer(buffer.data, dtype=np.uint8).reshape((height, width, -1))
+        planes = self._planes(out)
+        if self.factor is None or self._executor is None:
+            self._convert(pixels, buffer.pix_fmt, buffer.bottom_up, 0, self.output_size[1], planes)
+            return
+        # Even numbers of output rows per band
+        pairs = self.output_size[1] // 2
+        edges = [2 * (pairs * band // self.threads) for band in range(self.threads + 1)]
+        factor = self.factor
+
+        def band(index: int):
+            top, bottom = edges[index], edges[index + 1]
+            if top == bottom:
+                return
+            if buffer.bottom_up:
+                # The frame's top rows are at the end of the buffer
+                src = pixels[height - bottom * factor:height - top * factor]
+            else:
+                src = pixels[top * factor:bottom * factor]
+            self._convert(src, buffer.pix_fmt, buffer.bottom_up, top, bottom, planes)
+
+        for _ in self._executor.map(band, range(self.threads)):
+            pass
+
+    def convert_rows(self, pixels: np.ndarray, pix_fmt: str, top: int, out):
+        """
+        Converts a block of input rows, top row first and a multiple of
+        rows_per_step high, into the output rows starting at `top`.
+        """
+        rows = len(pixels) // self.factor
+        self._convert(pixels, pix_fmt, False, top, top + rows, self._planes(out))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
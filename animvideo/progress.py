@@ -0,0 +1,191 @@
+import contextlib
+import subprocess
+import threading
+import time
+from typing import IO, Iterator, Optional
+
+# Options that make FFmpeg report its progress as key=value lines on
+# stdout, which must be a pipe.
+PROGRESS_ARGS = ['-progress', 'pipe:1']
+
+class FFmpegMonitor:
+    """
+    Follows an FFmpeg process started with PROGRESS_ARGS. A reader thread
+    parses the progress reports, and a watchdog prints a warning when FFmpeg
+    seems stuck.
+
+    Producers write frames through write(), which counts them and the time
+    spent writing, and turns a broken pipe into an error with FFmpeg's exit
+    code. Producers with a background writer also wrap the time the
+    renderer waits for a free buffer in waiting(). Comparing the two sides
+    tells whether rendering or encoding is the bottleneck.
+
+    If FFmpeg reads its input from files rather than the pipe, pass how
+    many frames there are as input_frames.
+
+    Rates and shares are over the time from `started`, a time.monotonic()
+    value such as when the producer was created, to the end of the last
+    write. It defaults to now.
+
+    FFmpeg counts as stalled when a write has been blocked for
+    `stall_timeout` seconds, or, if it reads files, when it hasn't reported
+    progress for that long.
+    """
+    def __init__(self, process: subprocess.Popen, output_path: str, stall_timeout: float = 30.0, input_frames: Optional[int] = None,
+                 started: Optional[float] = None):
+        if process.stdout is None:
+            raise ValueError("FFmpeg's stdout must be a pipe to follow its progress")
+        self.process = process
+        self.output_path = output_path
+        self.stall_timeout = stall_timeout
+        self.reads_files = input_frames is not None
+        self._lock = threading.Lock()
+        # The last complete progress report
+        self._report: dict[str, str] = {}
+        self._last_report = time.monotonic()
+        self._frames_written = input_frames or 0
+        self._started = time.monotonic() if started is None else started
+        self._last_write: Optional[float] = None
+        # When the write in progress started, if one is
+        self._write_started: Optional[float] = None
+        self._writing = 0.0
+        self._wait = 0.0
+        self._max_lag = 0
+        self._stalls = 0
+        self._stalled = False
+        self._done = threading.Event()
+        self._reader = threading.Thread(target=self._read, name='ffmpeg-progress', daemon=True)
+        self._reader.start()
+        self._watchdog: Optional[threading.Thread] = None
+        if stall_timeout > 0:
+            self._watchdog = threading.Thread(target=self._watch, name='ffmpeg-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def _read(self):
+        report: dict[str, str] = {}
+        for line in self.process.stdout:
+            key, _, value = line.decode(errors='replace').strip().partition('=')
+            report[key] = value
+            # Each report ends with progress=continue, or progress=end
+            if key == 'progress':
+                with self._lock:
+                    self._report = report
+                    self._last_report = time.monotonic()
+                    self._stalled = False
+                    self._max_lag = max(self._max_lag, self._frames_written - self._encoded())
+                report = {}
+
+    def _watch(self):
+        while not self._done.wait(min(1.0, self.stall_timeout / 4)):
+            now = time.monotonic()
+            with self._lock:
+                if self._write_started is not None:
+                    idle = now - max(self._write_started, self._last_report)
+                elif self.reads_files:
+                    idle = now - self._last_report
+                else:
+                    continue
+                if idle < self.stall_timeout or self._stalled:
+                    continue
+                self._stalled = True
+                self._stalls += 1
+                pending = self._frames_written - self._encoded()
+            print(f"FFmpeg writing '{self.output_path}' looks stalled: no progress for {idle:.0f} s, {pending} frames not encoded yet")
+
+    def _encoded(self) -> int:
+        try:
+            return int(self._report.get('frame', 0))
+        except ValueError:
+            return 0
+
+    def check(self):
+        """
+        Raises an error if FFmpeg has already exited with an error.
+        """
+        returncode = self.process.poll()
+        if returncode is not None and returncode != 0:
+            raise RuntimeError(f"FFmpeg exited with code {returncode} while writing '{self.output_path}'")
+
+    def write(self, stream: IO[bytes], data, frames: int = 1):
+        """
+        Writes data to FFmpeg's stdin, completing `frames` frames.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._write_started = started
+        try:
+            stream.write(data)
+        except BrokenPipeError as e:
+            returncode = self.process.wait()
+            raise RuntimeError(f"FFmpeg exited with code {returncode} while writing '{self.output_path}'") from e
+        finally:
+            with self._lock:
+                self._write_started = None
+        with self._lock:
+            self._frames_written += frames
+            self._last_write = time.monotonic()
+            self._writing += self._last_write - started
+            self._stalled = False
+
+    @contextlib.contextmanager
+    def waiting(self) -> Iterator[None]:
+        """
+        Counts the time spent in the block as the renderer waiting for a
+        buffer that a background writer hasn't written to FFmpeg yet. Writes
+        are timed by write() and shouldn't be wrapped in this.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._wait += elapsed
+
+    def finish(self):
+        """
+        Collects the last progress report once FFmpeg has exited, and stops
+        the watchdog.
+        """
+        self._reader.join()
+        self._done.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Frames written and encoded, FFmpeg's encode rate, bitrate and speed,
+        the rate frames were written at, how many frames FFmpeg is behind
+        and was behind at most, the time spent in write() and waiting for a
+        writer's buffer, in total and as a share of the time from `started`
+        to the last write, and the stalls.
+        """
+        with self._lock:
+            report = dict(self._report)
+            written = self._frames_written
+            encoded = self._encoded()
+            elapsed = self._last_write - self._started if self._last_write is not None else 0.0
+            writing = self._writing
+            wait = self._wait
+            max_lag = max(self._max_lag, written - encoded)
+            stalls = self._stalls
+        try:
+            encode_fps = float(report.get('fps', 0.0))
+        except ValueError:
+            encode_fps = 0.0
+        return {
+            'frames_written': written,
+            'frames_encoded': encoded,
+            'encode_fps': encode_fps,
+            'write_fps': round(written / elapsed, 2) if elapsed > 0 else 0.0,
+            'bitrate': report.get('bitrate', ''),
+            'speed': report.get('speed', ''),
+            'lag': written - encoded,
+            'max_lag': max_lag,
+            'write_s': round(writing, 3),
+            'write_share': round(writing / elapsed, 3) if elapsed > 0 else 0.0,
+            'buffer_wait_s': round(wait, 3),
+            'buffer_wait_share': round(wait / elapsed, 3) if elapsed > 0 else 0.0,
+            'stalls': stalls,
+        }
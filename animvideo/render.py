@@ -0,0 +1,252 @@
+import atexit
+import itertools
+import math
+import multiprocessing
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional
+from animvideo.cache import FrameCache
+from animvideo.config import Config
+from animvideo.image import Img, FrameBuffer, ImagePool, RingSpriteCache, acquire, release, frombytes, set_use_opencv_for_glow, set_implementation, set_ring_sprite_cache, set_glow_engine, set_image_pool, get_implementation
+from animvideo.image._glow import ksize_sigma
+from animvideo.plan import RenderPlan
+from animvideo.shm import FrameRing, copy_frame, slot_image
+
+# The frame cache of this process, set up by configure.
+_frame_cache: Optional[FrameCache] = None
+
+def get_frame_cache() -> Optional[FrameCache]:
+    return _frame_cache
+
+# Rings drawn and rings skipped for being off the canvas, in this process.
+_cull_stats = {'drawn': 0, 'culled': 0}
+
+def get_cull_stats() -> dict[str, int]:
+    return dict(_cull_stats)
+
+def configure(config: Config):
+    """
+    Selects the image backend described by the config for this process, and
+    sets up the image pool and the frame cache if there are any.
+    """
+    global _frame_cache
+    if config.GLOW_COMBO:
+        set_use_opencv_for_glow(True)
+    set_implementation(config.IMAGE_IMPL)
+    set_glow_engine(config.GLOW_ENGINE, config.GLOW_QUALITY)
+    if config.RING_SPRITES:
+        set_ring_sprite_cache(RingSpriteCache(max_bytes=config.RING_SPRITE_CACHE_MB * 1024 * 1024))
+    if config.IMAGE_POOL > 0:
+        set_image_pool(ImagePool(max_images=config.IMAGE_POOL))
+    if config.FRAME_CACHE_DIR:
+        _frame_cache = FrameCache(config.FRAME_CACHE_DIR, config, max_bytes=config.FRAME_CACHE_MB * 1024 * 1024)
+
+def render_frame(config: Config, plan: RenderPlan, add_rot: int, image: Optional[Img] = None) -> Img:
+    """
+    Draws and glows a single frame, leaving the glow out if FFmpeg applies
+    it, or loads it from the frame cache. The caller owns the returned image
+    and must release() it.
+
+    If `image` is given, the frame is drawn into it after clearing it, unless
+    it comes from the cache. Whether the returned image is `image` tells.
+    """
+    cache = _frame_cache
+    if cache is not None:
+        data = cache.get(add_rot)
+        if data is not None:
+            return frombytes(config.CANVAS_SIZE, data)
+    if image is None:
+        image = acquire(config.CANVAS_SIZE, (0, 0, 0))
+    else:
+        image.clear((0, 0, 0))
+    if config.CULL:
+        visible = plan.visible(add_rot)
+        _cull_stats['drawn'] += len(visible)
+        _cull_stats['culled'] += len(plan) - len(visible)
+        image.rings(plan.centers(add_rot, visible), plan.radii[visible], plan.colors[visible])
+    else:
+        image.rings(plan.centers(add_rot), plan.radii, plan.colors)
+    if not config.FFMPEG_GLOW:
+        image.glow(radius=config.GLOW_RADIUS)
+    if cache is not None:
+        cache.put(add_rot, image.tobytes())
+    return image
+
+def tile_halo(config: Config) -> int:
+    """
+    Returns how far the glow reaches, in pixels. A tile drawn with this many
+    extra pixels around it glows its inner part exactly like the full frame
+    would, except for the approximate pyramid engine.
+    """
+    if config.FFMPEG_GLOW:
+        return 0
+    radius = config.GLOW_RADIUS
+    # Pillow's Gaussian radius is the standard deviation, the others derive
+    # it from a kernel size. Three box blurs reach at most 3 sigma + 3.
+    sigma = radius if config.IMAGE_IMPL == 'pillow' else ksize_sigma(radius)
+    return max(radius // 2, math.ceil(3 * sigma) + 3)
+
+def render_tiles(config: Config, plan: RenderPlan, add_rot: int) -> Iterator[tuple[int, FrameBuffer]]:
+    """
+    Draws and glows a frame in TILE_SIZE squares and yields it as (top,
+    strip) pairs of finished RGB rows, top to bottom. The strip's data has
+    the shape (rows, width, 3) and is only valid until the next strip is
+    requested.
+
+    Each tile is drawn with a halo of tile_halo() pixels so it glows as part
+    of the full frame, and gets only the rings overlapping it. Memory grows
+    with the tile size and the canvas width, never with the full canvas.
+    Frames rendered this way don't go through the frame cache.
+    """
+    if config.IMAGE_IMPL == 'panda3d':
+        raise ValueError("Tiled rendering needs a CPU image backend, not panda3d")
+    tile_size = config.TILE_SIZE
+    width, height = config.CANVAS_SIZE
+    halo = tile_halo(config)
+    if config.CULL:
+        visible = plan.visible(add_rot)
+        _cull_stats['drawn'] += len(visible)
+        _cull_stats['culled'] += len(plan) - len(visible)
+    else:
+        visible = np.arange(len(plan))
+    centers, radii, colors = plan.centers(add_rot, visible), plan.radii[visible], plan.colors[visible]
+    # Anti-aliasing reaches a little past the outer radius
+    reach = radii[:, 1] + 2
+    strip = np.empty((min(tile_size, height), width, 3), dtype=np.uint8)
+    for top in range(0, height, tile_size):
+        bottom = min(top + tile_size, height)
+        y0, y1 = max(top - halo, 0), min(bottom + halo, height)
+        in_row = (centers[:, 1] + reach >= y0) & (centers[:, 1] - reach < y1)
+        for left in range(0, width, tile_size):
+            right = min(left + tile_size, width)
+            x0, x1 = max(left - halo, 0), min(right + halo, width)
+            selected = in_row & (centers[:, 0] + reach >= x0) & (centers[:, 0] - reach < x1)
+            tile = acquire((x1 - x0, y1 - y0), (0, 0, 0))
+            try:
+                tile.rings(centers[selected], radii[selected], colors[selected], origin=(x0, y0))
+                if not config.FFMPEG_GLOW:
+                    tile.glow(radius=config.GLOW_RADIUS)
+                pixels = np.frombuffer(tile.tobytes(), dtype=np.uint8).reshape((y1 - y0, x1 - x0, 3))
+                strip[:bottom - top, left:right] = pixels[top - y0:bottom - y0, left - x0:right - x0]
+            finally:
+                release(tile)
+        yield top, FrameBuffer(memoryview(strip[:bottom - top]), 'rgb24')
+
+# Per-process state of a render worker, set up by _init_worker.
+_worker_config: Optional[Config] = None
+_worker_plan: Optional[RenderPlan] = None
+_worker_ring: Optional[FrameRing] = None
+
+def _init_worker(config: Config, plan: RenderPlan, ring: Optional[FrameRing] = None):
+    global _worker_config, _worker_plan, _worker_ring
+    configure(config)
+    _worker_config = config
+    _worker_plan = plan
+    _worker_ring = ring
+    if ring is not None:
+        atexit.register(ring.close)
+
+def _render_frame_bytes(add_rot: int) -> bytes:
+    assert _worker_config is not None and _worker_plan is not None
+    image = render_frame(_worker_config, _worker_plan, add_rot)
+    try:
+        return image.tobytes()
+    finally:
+        release(image)
+
+def _render_frame_to_slot(add_rot: int, slot: int) -> int:
+    assert _worker_config is not None and _worker_plan is not None and _worker_ring is not None
+    pixels = _worker_ring.view(slot)
+    # Backends that can draw into the slot do, the others are copied in once
+    target = get_implementation().wrap(pixels)
+    image = render_frame(_worker_config, _worker_plan, add_rot, image=target)
+    if image is not target:
+        try:
+            copy_frame(image.as_buffer(), pixels)
+        finally:
+            release(image)
+    return slot
+
+def render_frames(config: Config, plan: RenderPlan, frames: Iterable[int], workers: int = 1, window: Optional[int] = None,
+                  shared: bool = False) -> Iterator[tuple[int, Img]]:
+    """
+    Renders frames and yields (add_rot, image) pairs in the order of
+    `frames`. The caller must release() each image.
+
+    With more than one worker, frames are rendered on a process pool where
+    each worker owns its own image backend. At most `window` frames (twice
+    the worker count by default) are in flight or waiting to be reordered,
+    so memory stays flat however far ahead the workers get.
+
+    With `shared`, workers render into the slots of a FrameRing rather than
+    pickling the pixels back, and the images yielded are those slots. The
+    ring has one slot more than the window, so the caller should release
+    each image before asking for the next, or workers run out of slots.
+    """
+    if workers <= 1:
+        for add_rot in frames:
+            yield add_rot, render_frame(config, plan, add_rot)
+        return
+
+    window = window or workers * 2
+    if shared:
+        yield from _render_frames_shared(config, plan, frames, workers, window)
+        return
+    frames = iter(frames)
+    pending: deque[tuple[int, Future[bytes]]] = deque()
+    # Spawn rather than fork, the backends keep native state that doesn't
+    # survive a fork.
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(config, plan))
+    try:
+        for add_rot in itertools.islice(frames, window):
+            pending.append((add_rot, executor.submit(_render_frame_bytes, add_rot)))
+        while pending:
+            add_rot, future = pending.popleft()
+            data = future.result()
+            # Refill the window before handing the frame out, so workers stay
+            # busy while the caller encodes.
+            for next_rot in itertools.islice(frames, 1):
+                pending.append((next_rot, executor.submit(_render_frame_bytes, next_rot)))
+            yield add_rot, frombytes(config.CANVAS_SIZE, data)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def _render_frames_shared(config: Config, plan: RenderPlan, frames: Iterable[int], workers: int, window: int) -> Iterator[tuple[int, Img]]:
+    frames = iter(frames)
+    pending: deque[tuple[int, Future[int]]] = deque()
+    ring = FrameRing(config.CANVAS_SIZE, window + 1)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(config, plan, ring))
+
+    # A frame taken from `frames` that is still waiting for a free slot
+    waiting: list[int] = []
+
+    def fill():
+        while len(pending) < window:
+            add_rot = waiting.pop() if waiting else next(frames, None)
+            if add_rot is None:
+                return
+            slot = ring.acquire()
+            if slot is None:
+                waiting.append(add_rot)
+                return
+            pending.append((add_rot, executor.submit(_render_frame_to_slot, add_rot, slot)))
+
+    try:
+        fill()
+        while pending:
+            add_rot, future = pending.popleft()
+            slot = future.result()
+            # Refill before handing the frame out, so workers stay busy while
+            # the caller encodes.
+            fill()
+            yield add_rot, slot_image(ring, slot)
+            if not pending:
+                fill()
+                if waiting and not pending:
+                    raise RuntimeError("Every frame slot is taken, release frames before asking for more")
+    finally:
+        executor.shutdown(cancel_futures=True)
+        ring.close()
@@ -7,23 +7,24 @@ from panda3d.core import (
     WindowProperties,
     NodePath,
     Vec4,
-    GeomVertexFormat,
-    GeomVertexData,
-    Geom,
-    GeomVertexWriter,AmbientLight, VBase4,
-    GeomNode,
+    AmbientLight, VBase4,
     OrthographicLens,
     Texture,
-    GeomTristrips,
 )
 from direct.showbase.ShowBase import ShowBase
+from animvideo.image import FrameBuffer
+from animvideo.image._mesh import ring_mesh, ring_segments
+from animvideo.plan import RenderPlan, visible_arcs
+import cv2
+import numpy as np
 import math
-from typing import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
 
 _radians = math.radians
 
-def _ncircles(disc_radius, radius):
-    return math.floor(math.pi / math.asin(radius / disc_radius))
+# Sectors each orbital is split into for culling
+_SECTORS = 16
 
 class Panda3dScene(_scene.Scene):
     def create(self):
@@ -36,30 +37,40 @@ class Panda3dScene(_scene.Scene):
         fb_props.set_rgba_bits(8, 8, 8, 0)
         fb_props.set_depth_bits(24)
 
+        self._scene = NodePath("scene")
+        lens = OrthographicLens()
+        lens.set_film_size(size[0], size[1])
+        lens.set_near_far(-10, 10)
+
         self._buffer = base.graphicsEngine.make_output(
             base.pipe, "offscreen buffer", -2,
             fb_props, win_props,
             GraphicsPipe.BF_refuse_window,
         )
-        tex = Texture()
-        tex.setup_2d_texture(size[0], size[1], Texture.T_unsigned_byte, Texture.F_rgb8)
-        self._buffer.add_render_texture(tex, GraphicsOutput.RTMCopyRam)
-        self._tex = tex
+        # Frames are rendered into the two textures in turn, so one can be
+        # consumed while the next frame renders into the other
+        self._textures = []
+        for _ in range(2):
+            tex = Texture()
+            tex.setup_2d_texture(size[0], size[1], Texture.T_unsigned_byte, Texture.F_rgb8)
+            self._textures.append(tex)
+        self._current = 0
+        self._tex = self._textures[0]
+        self._buffer.add_render_texture(self._tex, GraphicsOutput.RTMCopyRam)
+        self._consumer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scene-consumer')
+        self._consuming: Optional[Future] = None
 
         r, g, b = (0, 0, 0)
         self._buffer.set_clear_color(Vec4(r/255.0, g/255.0, b/255.0, 1.0))
 
-        self._scene = NodePath("scene")
         self._camera = base.make_camera(self._buffer)
         self._camera.reparent_to(self._scene)
-
-        lens = OrthographicLens()
-        lens.set_film_size(size[0], size[1])
-        lens.set_near_far(-10, 10)
         self._camera.node().set_lens(lens)
         # Position the camera so that the scene coordinates match pixel coordinates
         self._camera.set_pos(0, 0, 1)
         self._camera.set_hpr(0, -90, 0)
+        # Whether the texture holds the frame for the current time
+        self._rendered = False
 
         ambient_light = AmbientLight("ambient light")
         ambient_light.set_color(VBase4(1.0, 1.0, 1.0, 1.0)) # A dim gray light
@@ -69,69 +80,50 @@ class Panda3dScene(_scene.Scene):
         self._scene.set_light(ambient_lnp)
 
 
-        def _make_ring_proto(segments=16):
-            fmt = GeomVertexFormat.get_v3()  # no per-vertex colors; we'll set color per-instance
-            vdata = GeomVertexData('unit_ring', fmt, Geom.UH_static)
-            vdata.set_num_rows((segments + 1) * 2)
-
-            vw = GeomVertexWriter(vdata, 'vertex')
-            # Unit ring with outer=1, inner=k kept in X-Y plane
-            k = 0.5  # default thickness; will be overridden via nonuniform scale if needed
-            for i in range(segments + 1):
-                t = (i / segments) * 2.0 * math.pi
-                c = math.cos(t); s = math.sin(t)
-                vw.add_data3(k*c, k*s, 0)  # inner
-                vw.add_data3(c, s, 0)      # outer
-
-            prim = GeomTristrips(Geom.UH_static)
-            prim.add_next_vertices((segments + 1) * 2)
-            prim.close_primitive()
-
-            geom = Geom(vdata); geom.add_primitive(prim)
-            node = GeomNode('ring_proto'); node.add_geom(geom)
-            return node
-
-        self._ring_proto = NodePath(_make_ring_proto())
-
-        def red_ring(parent, level, rotation):
-            config = self.config
-            rotprime = rotation * 6 % (2 * math.pi)
-            quadnum = int(rotation * 3 / (math.pi / 2))
-            cosine = abs(math.cos(rotprime))
-            if quadnum % 3 == 0:
-                quadrant = config.COLORS0[level % len(config.COLORS0)]
-            else:
-                quadrant = config.COLORS1[level % len(config.COLORS1)]
-            mult = 1 - math.pow(cosine, 2)
-            quadrant = (quadrant[0] * mult, quadrant[1] * mult, quadrant[2] * mult)
-
-            self._ring(color=quadrant,
-                parent=parent,
-                inner_radius=config.INNER_RADIUS, outer_radius=config.OUTER_RADIUS,
-                center_x=-level * config.OUTER_RADIUS * 2 - config.ADJUSTMENT,
-                center_y=0,
-                rotation=rotation
-            )
-
+        # Rings beyond this margin around the canvas can't touch it
+        margin = self.config.OUTER_RADIUS + 2
+        half_width = size[0] / 2 + margin
+        half_height = size[1] / 2 + margin
 
+        plan = RenderPlan.from_config(self.config)
+        segments = ring_segments(self.config.OUTER_RADIUS)
         self._orbitals = []
+        # Per level, the sectors of the orbital, their ring counts, and the
+        # angles at which rings are on the canvas
+        self._sectors = []
+        self._sector_rings = []
+        self._arcs = []
         for level in range(1, self.config.LEVELS):
             # Each orbital is its own node path
             orbital = NodePath(f'orbital_{level}')
             orbital.reparent_to(self._scene)
             self._orbitals.append(orbital)
-            n = _ncircles(level * self.config.OUTER_RADIUS * 2 + self.config.ADJUSTMENT, self.config.OUTER_RADIUS)
-            #print(f"Level {level}: {n} circles would fit.")
-            cnt = 0
-            rotation = 0.0
-            while rotation < 360.0:
-                red_ring(parent=orbital, level=level, rotation=_radians(rotation))
-                rotation += 360.0 / n
-                cnt += 1
-            orbital.flatten_strong()
+            start, end = int(plan.level_starts[level]), int(plan.level_starts[level + 1])
+            angles = plan.angles[start:end]
+            distance = level * self.config.OUTER_RADIUS * 2 + self.config.ADJUSTMENT
+            # Rings start to the left of the center, the orbital turns them
+            centers = np.stack([-distance * np.cos(angles), -distance * np.sin(angles)], axis=1)
+            # Split into sectors that can be hidden while off the canvas, each
+            # a single mesh
+            sector_of = np.minimum((angles / (2 * math.pi) * _SECTORS).astype(np.int64), _SECTORS - 1)
+            sectors = []
+            sector_rings = []
+            for i in range(_SECTORS):
+                in_sector = sector_of == i
+                mesh = ring_mesh(f'sector_{level}_{i}', centers[in_sector], plan.radii[start:end, 1][in_sector],
+                                 plan.colors[start:end][in_sector], segments)
+                sectors.append(orbital.attach_new_node(mesh))
+                sector_rings.append(int(in_sector.sum()))
+            self._sectors.append(sectors)
+            self._sector_rings.append(sector_rings)
+            self._arcs.append(visible_arcs(distance, half_width, half_height))
         self._scene.analyze()
 
+        self._rings_drawn = 0
+        self._rings_culled = 0
+        self._visible_rings = 0
         self._time = 0.0
+        self._cull(0.0)
 
     @property
     def time(self) -> float:
@@ -145,66 +137,101 @@ class Panda3dScene(_scene.Scene):
         for level in range(1, self.config.LEVELS):
             level_rot = add_rot * (1.0 - level / self.config.LEVELS)
             self._orbitals[level - 1].set_hpr(level_rot, 0.0, 0.0)
+        self._cull(add_rot)
+        self._rendered = False
+
+    def _cull(self, add_rot: float):
+        """
+        Hides the sectors of each orbital that are off the canvas at the
+        given rotation.
+        """
+        two_pi = 2 * math.pi
+        sector_span = two_pi / _SECTORS
+        self._visible_rings = 0
+        for level in range(1, self.config.LEVELS):
+            arcs = self._arcs[level - 1]
+            sectors = self._sectors[level - 1]
+            sector_rings = self._sector_rings[level - 1]
+            # A ring at rotation r sits at r + pi from the center, before the
+            # orbital turns
+            shift = math.pi + _radians(add_rot * (1.0 - level / self.config.LEVELS))
+            for i, sector in enumerate(sectors):
+                lower = (i * sector_span + shift) % two_pi
+                upper = lower + sector_span
+                visible = any(lower <= arc_end + offset and arc_start + offset <= upper
+                              for arc_start, arc_end in arcs for offset in (0.0, two_pi))
+                if visible:
+                    sector.show()
+                    self._visible_rings += sector_rings[i]
+                else:
+                    sector.hide()
+
+    def _render(self):
+        """
+        Renders the frame for the current time, unless that has been done
+        already.
+        """
+        if not self._rendered:
+            self._base.graphicsEngine.render_frame()
+            self._rings_drawn += self._visible_rings
+            self._rings_culled += sum(map(sum, self._sector_rings)) - self._visible_rings
+            self._rendered = True
 
-    def _rearrange(self, data: bytes) -> bytes:
-        # Flip vertically to match conventional top-to-bottom rows
-        w, h = self._size
-        row_bytes = w * 3
-        return b''.join(
-            data[y*row_bytes:(y+1)*row_bytes] for y in reversed(range(h))
-        )
-
-    def tobytes(self) -> bytes:
-        base = self._base
-        base.graphicsEngine.render_frame()
-        img = self._tex.get_ram_image_as("RGB")
-        if not img:
-            raise RuntimeError("Texture has no RAM image")
-        data = bytes(img)
-
-        return self._rearrange(data)
-
-    def consume_bytes(self, consumer: Callable[[bytes], int]):
-        base = self._base
-        base.graphicsEngine.render_frame()
-        img = self._tex.get_ram_image_as("RGB")
+    @property
+    def cull_stats(self) -> dict[str, int]:
+        """
+        Rings in visible and in hidden sectors, summed over rendered frames.
+        """
+        return {'drawn': self._rings_drawn, 'culled': self._rings_culled}
+
+    def as_buffer(self) -> FrameBuffer:
+        """
+        Returns the frame for the current time without copying it. The
+        buffer is only valid until the time changes.
+        """
+        self._render()
+        img = self._tex.get_ram_image()
         if not img:
             raise RuntimeError("Texture has no RAM image")
-        data = bytes(img)
+        # Panda3D keeps RGB textures as BGR, bottom row first
+        return FrameBuffer(memoryview(img), 'bgr24', bottom_up=True)
 
+    def tobytes(self) -> bytes:
+        # OpenCV swaps the channels of the flipped view much faster than
+        # NumPy copies it with reversed channels.
         w, h = self._size
-        row_bytes = w * 3
-        for y in reversed(range(h)):
-            row = data[y*row_bytes:(y+1)*row_bytes]
-            pos = 0
-            while pos < len(row):
-                if pos == 0:
-                    proc = consumer(row)
-                else:
-                    proc = consumer(row[pos:])
-                pos += proc
+        data = np.frombuffer(self.as_buffer().data, dtype=np.uint8).reshape((h, w, 3))
+        return cv2.cvtColor(data[::-1], cv2.COLOR_BGR2RGB).tobytes()
+
+    def consume(self, consumer: Callable[[FrameBuffer], None]):
+        """
+        Renders the frame and passes it to `consumer` on a background
+        thread, as as_buffer() exports it, bottom-up bgr24, without copying.
+        Returns once the previous frame has been consumed, and switches to
+        the other texture, so the next frame renders while this one is
+        consumed. Panda3D releases the GIL while it renders.
+        """
+        buffer = self.as_buffer()
+        # The previous frame is in the other texture, which is rendered
+        # into next
+        self.flush()
+        self._consuming = self._consumer.submit(consumer, buffer)
+        self._current = 1 - self._current
+        self._tex = self._textures[self._current]
+        self._buffer.clear_render_textures()
+        self._buffer.add_render_texture(self._tex, GraphicsOutput.RTMCopyRam)
+        self._rendered = False
+
+    def flush(self):
+        consuming, self._consuming = self._consuming, None
+        if consuming is not None:
+            consuming.result()
 
     def save(self, filename: str):
-        base = self._base
-        base.graphicsEngine.render_frame()
-        self._buffer.save_screenshot(filename)
+        self._render()
+        self._tex.write(filename)
 
 
     @property
     def _size(self):
         return self.config.CANVAS_SIZE
-
-    def _ring(self, parent: NodePath, color: tuple[int, int, int], inner_radius: int, outer_radius: int, center_x: int, center_y: int, rotation: float = 0.0):
-        # Place relative to image center with rotation about image center
-        dx = center_x
-        dy = center_y
-        c = math.cos(rotation); s = math.sin(rotation)
-        rx = dx * c - dy * s
-        ry = dx * s + dy * c
-        px = rx
-        py = ry
-
-        inst = self._ring_proto.copy_to(parent)
-        inst.set_pos(px, py, 0)
-        inst.set_scale(outer_radius, outer_radius, 1)
-        inst.set_color(color[0]/255.0, color[1]/255.0, color[2]/255.0, 1.0)
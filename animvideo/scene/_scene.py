@@ -1,5 +1,6 @@
 import abc
 from animvideo.config import Config
+from animvideo.image import FrameBuffer
 from typing import Callable
 
 class Scene(abc.ABC):
@@ -29,6 +30,21 @@ class Scene(abc.ABC):
     def tobytes(self) -> bytes:
         ...
 
-    @abc.abstractmethod
-    def consume_bytes(self, consumer: Callable[[bytes], int]):
-        ...
+    def as_buffer(self) -> FrameBuffer:
+        return FrameBuffer(memoryview(self.tobytes()), 'rgb24')
+
+    def consume(self, consumer: Callable[[FrameBuffer], None]):
+        """
+        Passes the frame's as_buffer() to `consumer`, which must be done
+        with it when it returns. Scenes may call the consumer on another
+        thread after returning, so they can render the next frame meanwhile;
+        flush() waits for it.
+        """
+        consumer(self.as_buffer())
+
+    def flush(self):
+        """
+        Waits until the last frame passed to consume() has been consumed,
+        and raises what the consumer raised.
+        """
+        pass
@@ -0,0 +1,45 @@
+import math
+from dataclasses import dataclass
+from animvideo.config import Config
+
+@dataclass
+class FrameSchedule:
+    """
+    The frames a run has to render, and which producer consumes each one.
+
+    Frames are identified by add_rot. A frame is only rendered if some
+    producer needs it, so a thumbnails-only run renders just the thumbnails.
+    """
+    # Every frame to render, in order.
+    frames: list[int]
+    # The frames that go into the video.
+    video: frozenset[int]
+    # The frames saved as thumbnails.
+    thumbs: frozenset[int]
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'FrameSchedule':
+        """
+        Plans the frames for the config's mode. Video frames run from
+        START_FRAME to END_FRAME in steps of SKIP, and thumbnails are the
+        video frames that are multiples of THUMB_INTERVAL. If FRAME_LIST is
+        set, exactly those frames are rendered, for both producers.
+        """
+        if config.THUMB_INTERVAL <= 0:
+            raise ValueError("THUMB_INTERVAL must be positive")
+        if config.FRAME_LIST:
+            if any(frame < 0 for frame in config.FRAME_LIST):
+                raise ValueError("FRAME_LIST must be non-negative")
+            video = thumbs = sorted(set(config.FRAME_LIST))
+        else:
+            video = range(config.START_FRAME, config.END_FRAME, config.SKIP)
+            # Thumbnails are multiples of both SKIP and THUMB_INTERVAL, since
+            # START_FRAME is a multiple of SKIP
+            step = math.lcm(config.SKIP, config.THUMB_INTERVAL)
+            thumbs = range(-(-config.START_FRAME // step) * step, config.END_FRAME, step)
+        video = frozenset(video) if config.MODE.enable_video else frozenset()
+        thumbs = frozenset(thumbs) if config.MODE.enable_thumbs else frozenset()
+        return cls(frames=sorted(video | thumbs), video=video, thumbs=thumbs)
+
+    def __len__(self) -> int:
+        return len(self.frames)
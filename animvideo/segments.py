@@ -0,0 +1,116 @@
+import dataclasses
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import ffmpeg
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from animvideo.config import Config
+from animvideo import trace
+
+def _frame_count(config: Config) -> int:
+    return len(range(config.START_FRAME, config.END_FRAME, config.SKIP))
+
+def segment_gop(config: Config, segments: int) -> int:
+    """
+    The keyframe interval of a segmented encode: GOP if it's set, otherwise
+    one second of frames, shortened so the frames still divide into
+    `segments` parts.
+    """
+    if config.GOP:
+        return config.GOP
+    return max(1, min(config.FPS, math.ceil(_frame_count(config) / segments)))
+
+def segment_ranges(config: Config, segments: int, gop: int) -> list[tuple[int, int]]:
+    """
+    Splits the frames from START_FRAME to END_FRAME into at most `segments`
+    contiguous (start, end) ranges of add_rot values. Every range but the
+    last holds a multiple of `gop` video frames, so the segments start on
+    the keyframes a single encode would have placed.
+    """
+    count = _frame_count(config)
+    per_segment = math.ceil(count / segments / gop) * gop
+    ranges = []
+    for first in range(0, count, per_segment):
+        start = config.START_FRAME + first * config.SKIP
+        end = min(start + per_segment * config.SKIP, config.END_FRAME)
+        ranges.append((start, end))
+    return ranges
+
+def _concat(config: Config, segments: list[Config], filename: str):
+    """
+    Joins the segments' copies of a video file into one in OUTPUT_DIR.
+    """
+    list_path = config.output_path("segments.txt")
+    with open(list_path, 'w') as f:
+        for segment in segments:
+            path = segment.output_path(filename)
+            if not os.path.exists(path):
+                raise RuntimeError(f"Segment '{path}' was not created")
+            # Paths in the list are relative to the list itself
+            f.write(f"file '{os.path.relpath(path, config.OUTPUT_DIR)}'\n")
+    ffmpeg.input(list_path, f='concat', safe=0).output(config.output_path(filename), c='copy').overwrite_output().run()
+    os.remove(list_path)
+
+def _merge_index(source: str, target: str):
+    """
+    Adds the frames of a segment's image sequence index to the joined one.
+    """
+    with open(source) as f:
+        frames = json.load(f)['frames']
+    with open(target) as f:
+        index = json.load(f)
+    index['frames'] = sorted(index['frames'] + frames, key=lambda frame: frame['number'])
+    with open(target, 'w') as f:
+        json.dump(index, f, indent=1)
+
+def run_segments(config: Config, create_video: Callable[..., None]):
+    """
+    Renders the video as SEGMENTS parts in parallel processes, then joins
+    them into output.mp4 with FFmpeg's concat demuxer, without re-encoding.
+
+    Each part is made by calling create_video in its own process with a
+    config restricted to the part's frames and writing to a segment_NNN
+    subdirectory, and with raise_errors=True so a failed part fails the
+    whole run. Thumbnail videos are joined the same way, other files such as
+    stills and image sequences are moved up into OUTPUT_DIR, and the
+    subdirectories are removed afterwards.
+    """
+    gop = segment_gop(config, config.SEGMENTS)
+    ranges = segment_ranges(config, config.SEGMENTS, gop)
+    if len(ranges) < config.SEGMENTS:
+        print(f"Warning: {_frame_count(config)} frames with a GOP of {gop} only make {len(ranges)} of the {config.SEGMENTS} segments requested")
+    configs = [
+        dataclasses.replace(config, OUTPUT_DIR=config.output_path(f"segment_{index:03d}"),
+                            START_FRAME_BASE=start, END_FRAME_BASE=end, SEGMENTS=1, GOP=gop)
+        for index, (start, end) in enumerate(ranges)
+    ]
+    for segment in configs:
+        os.makedirs(segment.OUTPUT_DIR, exist_ok=True)
+
+    print(f"Rendering {len(configs)} segments of up to {math.ceil((ranges[0][1] - ranges[0][0]) / config.SKIP)} frames")
+    # Spawn rather than fork, the backends keep native state that doesn't
+    # survive a fork.
+    with ProcessPoolExecutor(max_workers=len(configs), mp_context=multiprocessing.get_context('spawn')) as executor:
+        for future in [executor.submit(create_video, segment, raise_errors=True) for segment in configs]:
+            future.result()
+
+    _concat(config, configs, "output.mp4")
+    if config.MODE.enable_thumbs and os.path.exists(configs[0].output_path("thumbnails.mp4")):
+        _concat(config, [segment for segment in configs if os.path.exists(segment.output_path("thumbnails.mp4"))], "thumbnails.mp4")
+
+    for segment in configs:
+        for name in os.listdir(segment.OUTPUT_DIR):
+            if name in ("output.mp4", "thumbnails.mp4"):
+                continue
+            target = config.output_path(name)
+            if name == trace.TRACE_FILENAME and os.path.exists(target):
+                trace.merge(segment.output_path(name), target)
+            elif name.endswith('.json') and os.path.exists(target):
+                _merge_index(segment.output_path(name), target)
+            else:
+                shutil.move(segment.output_path(name), target)
+        shutil.rmtree(segment.OUTPUT_DIR)
+    print(f"Video '{config.output_path('output.mp4')}' joined from {len(configs)} segments.")
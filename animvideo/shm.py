@@ -0,0 +1,147 @@
+import cv2
+import numpy as np
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Optional
+from animvideo.image import Img, FrameBuffer
+from animvideo.image._numpy import _NumpyImage
+
+class FrameRing:
+    """
+    A fixed number of RGB frame slots in one block of shared memory, so
+    processes can hand frames to each other without pickling or piping the
+    pixels.
+
+    A slot belongs to whoever holds its index. The process that created the
+    ring hands free slots out with acquire() and takes them back with
+    release(); in between, the index travels with the work, e.g. as an
+    argument of a task for a render process and back as its result. Only
+    the holder reads or writes the slot, so no locking is needed.
+
+    Other processes attach by name, or get the ring pickled, which attaches
+    it on the other side. Attached rings can use slots but not hand them
+    out.
+    """
+    def __init__(self, size: tuple[int, int], slots: int, name: Optional[str] = None):
+        if slots < 1:
+            raise ValueError(f"A frame ring needs at least one slot, not {slots}")
+        width, height = size
+        self.size = size
+        self.slots = slots
+        self.frame_bytes = width * height * 3
+        self._owner = name is None
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=slots * self.frame_bytes)
+        else:
+            # The creator unlinks the block, the resource tracker mustn't
+            # when this process exits.
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+            if self._shm.size < slots * self.frame_bytes:
+                self._shm.close()
+                raise ValueError(f"Shared memory '{name}' is too small for {slots} frames of {width}x{height}")
+        self._frames: Optional[np.ndarray] = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=self._shm.buf)
+        self._free: Optional[deque[int]] = deque(range(slots)) if self._owner else None
+
+    @classmethod
+    def attach(cls, name: str, size: tuple[int, int], slots: int) -> 'FrameRing':
+        """
+        Opens a ring created by another process.
+        """
+        return cls(size, slots, name=name)
+
+    def __reduce__(self):
+        return FrameRing.attach, (self.name, self.size, self.slots)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def free(self) -> int:
+        """
+        How many slots are waiting to be handed out.
+        """
+        return len(self._free) if self._free is not None else 0
+
+    def view(self, index: int) -> np.ndarray:
+        """
+        Returns the slot's pixels as a writable (height, width, 3) RGB array
+        backed by the shared memory.
+        """
+        if self._frames is None:
+            raise RuntimeError("The frame ring is closed")
+        return self._frames[index]
+
+    def acquire(self) -> Optional[int]:
+        """
+        Hands out a free slot, or returns None if every slot is taken.
+        """
+        if self._free is None:
+            raise RuntimeError("Only the process that created a frame ring hands out its slots")
+        return self._free.popleft() if self._free else None
+
+    def release(self, index: int):
+        """
+        Takes a slot back once its holder is done with it.
+        """
+        if self._free is None:
+            raise RuntimeError("Only the process that created a frame ring takes its slots back")
+        self._free.append(index)
+
+    def close(self):
+        """
+        Unmaps the ring in this process, and frees the shared memory if this
+        process created it. Views must not be used afterwards.
+        """
+        self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views are still alive somewhere, the mapping goes when they do
+            pass
+        if self._owner:
+            self._owner = False
+            self._shm.unlink()
+
+class _SlotImage(_NumpyImage):
+    """
+    A frame in a ring slot. Releasing or destroying it hands the slot back.
+    """
+    def __init__(self, ring: FrameRing, index: int):
+        super().__init__(ring.view(index))
+        self._ring: Optional[FrameRing] = ring
+        self._index = index
+
+    def destroy(self):
+        ring, self._ring = self._ring, None
+        if ring is not None:
+            ring.release(self._index)
+
+def slot_image(ring: FrameRing, index: int) -> Img:
+    """
+    Wraps a slot of a ring created by this process as an image, without
+    copying it. Its as_buffer() is the shared memory itself, so producers
+    write the frame to FFmpeg straight from the slot. release() the image to
+    hand the slot back.
+    """
+    return _SlotImage(ring, index)
+
+def copy_frame(buffer: FrameBuffer, out: np.ndarray):
+    """
+    Copies an exported frame into `out`, an RGB array of the frame's size
+    such as a ring slot, converting its pixel format and row order.
+    """
+    height, width = out.shape[:2]
+    pixels = np.frombuffer(buffer.data, dtype=np.uint8).reshape((height, width, -1))
+    if buffer.bottom_up:
+        pixels = pixels[::-1]
+    pix_fmt = buffer.pix_fmt
+    if pix_fmt == 'rgb24':
+        if not np.shares_memory(pixels, out):
+            np.copyto(out, pixels)
+    elif pix_fmt == 'bgr24' and not buffer.bottom_up:
+        cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB, dst=out)
+    elif pix_fmt in ('bgr0', 'bgra') and not buffer.bottom_up:
+        cv2.cvtColor(pixels, cv2.COLOR_BGRA2RGB, dst=out)
+    else:
+        np.copyto(out, pixels[:, :, [pix_fmt.index(channel) for channel in 'rgb']])
@@ -0,0 +1,188 @@
+import cProfile
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+# Methods wrapped by instrument() for each kind of object.
+IMAGE_METHODS = ('ring', 'rings', 'glow', 'tobytes', 'as_buffer')
+SCENE_METHODS = ('consume', 'tobytes', 'as_buffer')
+PRODUCER_METHODS = ('add_frame', 'add_strip', 'finalize')
+
+# The name of the trace written into the output directory.
+TRACE_FILENAME = 'trace.json'
+
+class Tracer:
+    """
+    Collects spans as complete events in the Chrome trace event format,
+    which Perfetto and chrome://tracing open as a timeline per thread.
+    """
+    def __init__(self):
+        self._pid = os.getpid()
+        self._events: list[dict] = []
+        self._threads: dict[int, str] = {}
+
+    def add(self, name: str, category: str, start_ns: int, end_ns: int, args: Optional[dict] = None):
+        """
+        Records a span that started and ended at the given perf_counter_ns()
+        times, on the current thread.
+        """
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': start_ns / 1000.0, 'dur': (end_ns - start_ns) / 1000.0,
+                 'pid': self._pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        self._events.append(event)
+
+    @property
+    def events(self) -> list[dict]:
+        """
+        The recorded spans, preceded by the names of the process and its
+        threads.
+        """
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'tid': 0, 'args': {'name': f'animvideo {self._pid}'}}]
+        metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+                     for tid, name in self._threads.items()]
+        return metadata + self._events
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+# The tracer of this process, set by enable(). Spans cost a global lookup
+# and a comparison while it is None.
+_tracer: Optional[Tracer] = None
+
+def enable() -> Tracer:
+    """
+    Starts recording spans in this process.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+def finish(path: str):
+    """
+    Stops recording spans and saves them as a trace file, if tracing was
+    enabled.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.save(path)
+
+def merge(source: str, target: str):
+    """
+    Adds the events of one trace file to another, e.g. to join the traces
+    of processes that rendered parts of the same video.
+    """
+    with open(source) as f:
+        events = json.load(f)['traceEvents']
+    with open(target) as f:
+        trace = json.load(f)
+    trace['traceEvents'] += events
+    with open(target, 'w') as f:
+        json.dump(trace, f)
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_category', '_args', '_start')
+
+    def __init__(self, tracer: Tracer, name: str, category: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._tracer.add(self._name, self._category, self._start, time.perf_counter_ns(), self._args)
+
+_null_span = contextlib.nullcontext()
+
+def span(name: str, category: str = 'app', **args) -> contextlib.AbstractContextManager:
+    """
+    Returns a context manager that records the time spent in it as a span,
+    with `args` attached, or does nothing if tracing isn't enabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _null_span
+    return _Span(tracer, name, category, args)
+
+def _traced(method, name: str, category: str):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return method(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            tracer.add(name, category, start, time.perf_counter_ns())
+    wrapper.__traced__ = True
+    return wrapper
+
+def instrument(cls: type, methods: Iterable[str], category: str):
+    """
+    Wraps the given methods of a class, inherited ones included, so each
+    call is recorded as a span named after the class and the method. Does
+    nothing unless tracing is enabled, so untraced runs call the methods
+    directly. Methods are only wrapped once.
+    """
+    if _tracer is None:
+        return
+    for name in methods:
+        method = getattr(cls, name, None)
+        if method is None or getattr(method, '__traced__', False):
+            continue
+        setattr(cls, name, _traced(method, f'{cls.__name__}.{name}', category))
+
+# Every how many frames frames() profiles one, and the prefix of the dumps.
+_profile_every = 0
+_profile_prefix = ''
+
+def set_profiling(every: int, prefix: str):
+    """
+    Makes frames() profile every `every`th frame with cProfile and dump the
+    stats to `prefix`_NNNNNN.prof, for pstats or snakeviz. 0 turns it off.
+    """
+    global _profile_every, _profile_prefix
+    _profile_every = every
+    _profile_prefix = prefix
+
+def frames(numbers: Iterable[int]) -> Iterator[int]:
+    """
+    Yields frame numbers, treating the time from handing out a number until
+    the next one is requested as that frame's work. It is recorded as a
+    'frame' span, and profiled for frames picked by set_profiling().
+
+    Frames rendered by worker processes are only traced and profiled as far
+    as this process is concerned.
+    """
+    if _tracer is None and _profile_every <= 0:
+        yield from numbers
+        return
+    for index, number in enumerate(numbers):
+        tracer = _tracer
+        profiler = cProfile.Profile() if _profile_every > 0 and index % _profile_every == 0 else None
+        start = time.perf_counter_ns()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield number
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(f'{_profile_prefix}_{number:06d}.prof')
+            if tracer is not None:
+                tracer.add('frame', 'frame', start, time.perf_counter_ns(), {'number': number})
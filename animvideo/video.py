@@ -1,25 +1,96 @@
 import ffmpeg
 import abc
+import cv2
+import json
+import os
+import numpy as np
+import queue
 import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
 from typing import Tuple
-from animvideo.image import Img
+from animvideo import trace
+from animvideo.prep import FramePrep
+from animvideo.progress import PROGRESS_ARGS, FFmpegMonitor
+from animvideo.image import Img, FrameBuffer
+from animvideo.image._glow import ksize_sigma
 from animvideo.scene import Scene
-from typing import Union
+from typing import Optional, Union
+
+def glow_filter(radius: int, scale: float = 1.0) -> str:
+    """
+    Returns an FFmpeg filter graph that does what Img.glow(radius) does:
+    adds a Gaussian blurred copy of each frame to itself. The blend runs on
+    planar RGB so the addition happens per color channel.
+
+    For frames that were scaled down after rendering, pass the scale so the
+    blur shrinks with them.
+    """
+    return (f'format=gbrp,split[glow_source][glow_input];'
+            f'[glow_input]gblur=sigma={ksize_sigma(radius) * scale:.4f}:steps=4[glow_blurred];'
+            f'[glow_source][glow_blurred]blend=all_mode=addition')
+
+class _AssembledFrame:
+    """
+    A frame put together from strips, exported without copying it again.
+    Producers only call as_buffer() and save() on frames.
+    """
+    def __init__(self, size: Tuple[int, int], data: bytearray):
+        self._size = size
+        self._data = data
+
+    def as_buffer(self) -> FrameBuffer:
+        return FrameBuffer(memoryview(self._data), 'rgb24')
+
+    def save(self, filename: str):
+        Image.frombuffer('RGB', self._size, self._data, 'raw', 'RGB', 0, 1).save(filename, compress_level=1)
 
 class AbstractVideoProducer(abc.ABC):
     def __init__(self, output_path: str, size: Tuple[int, int], fps: int):
         self.output_path = output_path
         self.size = size
         self.fps = fps
+        self._assembly: Optional[bytearray] = None
+        # Encoder rates are measured from here
+        self._created = time.monotonic()
 
     @abc.abstractmethod
     def add_frame(self, frame: Union[Img, Scene], number: int):
         pass
 
+    def add_strip(self, strip: FrameBuffer, top: int, number: int):
+        """
+        Adds the RGB rows of frame `number` starting at row `top`, as yielded
+        by render_tiles(). A frame's strips arrive in order, and its last
+        strip completes it.
+
+        This assembles the strips into one buffer and adds the whole frame
+        straight from it. Producers that can consume rows as they arrive
+        override it.
+        """
+        rows = strip.data.shape[0]
+        row_bytes = strip.data.nbytes // rows
+        if top == 0:
+            self._assembly = bytearray(row_bytes * self.size[1])
+        self._assembly[top * row_bytes:(top + rows) * row_bytes] = strip.data.cast('B')
+        if top + rows == self.size[1]:
+            frame = _AssembledFrame(self.size, self._assembly)
+            self._assembly = None
+            self.add_frame(frame, number)
+
     @abc.abstractmethod
     def finalize(self):
         pass
 
+    @property
+    def stats(self) -> dict:
+        """
+        Progress of the encoder, for producers that run FFmpeg.
+        """
+        return {}
+
 class NoopProducer(AbstractVideoProducer):
     def __init__(self):
         super().__init__("", (0, 0), 0)
@@ -27,70 +98,585 @@ class NoopProducer(AbstractVideoProducer):
     def add_frame(self, frame: Union[Img, Scene], number: int):
         pass
 
+    def add_strip(self, strip: FrameBuffer, top: int, number: int):
+        pass
+
     def finalize(self):
         pass
 
 class GlobVideoProducer(AbstractVideoProducer):
-    def __init__(self, output_path: str, size: Tuple[int, int], fps: int, prefix: str):
+    def __init__(self, output_path: str, size: Tuple[int, int], fps: int, prefix: str, glow_radius: Optional[int] = None,
+                 stall_timeout: float = 30.0):
         super().__init__(output_path, size, fps)
         self.prefix = prefix
+        self.glow_radius = glow_radius
+        self.stall_timeout = stall_timeout
+        self._monitor: Optional[FFmpegMonitor] = None
+        self._frames = 0
 
     def add_frame(self, frame: Union[Img, Scene], number: int):
         frame.save(f"{self.prefix}_{number:06d}.png")
+        self._frames += 1
 
     def finalize(self):
-        stream = ffmpeg.input('red_ring_*.png', pattern_type='glob', framerate=self.fps).filter('scale', self.size[0] // 2, -1)
-        stream.output(self.output_path, pix_fmt='yuv420p', sws_flags='lanczos').overwrite_output().run()
+        stream = ffmpeg.input(f'{self.prefix}_*.png', pattern_type='glob', framerate=self.fps)
+        if self.glow_radius is not None:
+            stream = stream.filter('format', 'gbrp').split()
+            blurred = stream[1].filter('gblur', sigma=ksize_sigma(self.glow_radius), steps=4)
+            stream = ffmpeg.filter([stream[0], blurred], 'blend', all_mode='addition')
+        stream = stream.filter('scale', self.size[0] // 2, -1)
+        stream = stream.output(self.output_path, pix_fmt='yuv420p', sws_flags='lanczos').global_args(*PROGRESS_ARGS).overwrite_output()
+        process = stream.run_async(pipe_stdout=True)
+        self._monitor = FFmpegMonitor(process, self.output_path, self.stall_timeout, input_frames=self._frames, started=self._created)
+        returncode = process.wait()
+        self._monitor.finish()
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg exited with code {returncode} while writing '{self.output_path}'")
         print("Video created successfully!")
 
+    @property
+    def stats(self) -> dict:
+        return self._monitor.stats if self._monitor is not None else {}
+
+def _downsample(buffer: FrameBuffer, size: Tuple[int, int], thumb_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Scales an exported frame down and returns it as a contiguous RGB array,
+    reordering channels and rows only once it is small.
+    """
+    pixels = np.frombuffer(buffer.data, dtype=np.uint8).reshape((size[1], size[0], -1))
+    small = cv2.resize(pixels, thumb_size, interpolation=cv2.INTER_AREA)
+    if buffer.bottom_up:
+        small = small[::-1]
+    return np.ascontiguousarray(small[:, :, [buffer.pix_fmt.index(channel) for channel in 'rgb']])
+
+class ThumbnailProducer(AbstractVideoProducer):
+    """
+    A thumbnail video producer that scales each frame down to thumb_size in
+    process and streams it into FFmpeg, so full size frames are never
+    encoded or written to disk.
+
+    If stills_prefix is set, each thumbnail is also saved as a PNG at
+    thumbnail size by a background thread.
+
+    If glow_radius is set, FFmpeg applies the glow, shrunk to the thumbnail
+    size.
+
+    FFmpeg's progress is followed as described for FFmpegMonitor.
+    """
+    def __init__(self, output_path: str, size: Tuple[int, int], thumb_size: Tuple[int, int], fps: int,
+                 stills_prefix: Optional[str] = None, glow_radius: Optional[int] = None, stall_timeout: float = 30.0):
+        super().__init__(output_path, size, fps)
+        self.thumb_size = thumb_size
+        self.stills_prefix = stills_prefix
+        self.glow_radius = glow_radius
+        self.stall_timeout = stall_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self._monitor: Optional[FFmpegMonitor] = None
+        self._stills: queue.Queue[Optional[Tuple[np.ndarray, int]]] = queue.Queue(maxsize=4)
+        self._stills_writer: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        # The thumbnail being filled from strips, and an odd row left over
+        self._rows: Optional[np.ndarray] = None
+        self._carry: Optional[np.ndarray] = None
+
+    def _start(self):
+        width, height = self.thumb_size
+        command = [
+            'ffmpeg',
+            '-y',
+            *PROGRESS_ARGS,
+            '-f', 'rawvideo',
+            '-vcodec', 'rawvideo',
+            '-s', f'{width}x{height}',
+            '-pix_fmt', 'rgb24',
+            '-r', str(self.fps),
+            '-i', '-',
+            '-c:v', 'libx264',
+        ]
+        if self.glow_radius is not None:
+            command += ['-vf', glow_filter(self.glow_radius, width / self.size[0])]
+        command += ['-pix_fmt', 'yuv420p', self.output_path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._monitor = FFmpegMonitor(self.process, self.output_path, self.stall_timeout, started=self._created)
+
+    def _save_stills(self):
+        while True:
+            item = self._stills.get()
+            if item is None:
+                return
+            pixels, number = item
+            if self._error is None:
+                try:
+                    Image.fromarray(pixels).save(f"{self.stills_prefix}_{number:06d}.png", compress_level=1)
+                except BaseException as e:
+                    self._error = e
+
+    def add_frame(self, frame: Union[Img, Scene], number: int):
+        if self._error is not None:
+            raise RuntimeError(f"Saving a thumbnail failed: {self._error}") from self._error
+        self._add_thumbnail(_downsample(frame.as_buffer(), self.size, self.thumb_size), number)
+
+    def add_strip(self, strip: FrameBuffer, top: int, number: int):
+        """
+        Scales strips down as they arrive when the thumbnail is exactly half
+        the frame, so only the thumbnail is ever held in full. Pairs of rows
+        average the same way they do in a whole frame.
+        """
+        width, height = self.thumb_size
+        if self.size != (width * 2, height * 2):
+            super().add_strip(strip, top, number)
+            return
+        if self._error is not None:
+            raise RuntimeError(f"Saving a thumbnail failed: {self._error}") from self._error
+        pixels = np.asarray(strip.data)
+        if top == 0:
+            self._rows = np.empty((height, width, 3), dtype=np.uint8)
+            self._carry = None
+        if self._carry is not None:
+            pixels = np.concatenate([self._carry, pixels])
+            top -= 1
+        even = len(pixels) // 2 * 2
+        self._carry = pixels[even:].copy() if even < len(pixels) else None
+        if even:
+            self._rows[top // 2:(top + even) // 2] = cv2.resize(pixels[:even], (width, even // 2), interpolation=cv2.INTER_AREA)
+        if top + len(pixels) == self.size[1]:
+            rows, self._rows = self._rows, None
+            self._add_thumbnail(rows, number)
+
+    def _add_thumbnail(self, pixels: np.ndarray, number: int):
+        if self.process is None:
+            self._start()
+        self._monitor.check()
+        self._monitor.write(self.process.stdin, pixels)
+        if self.stills_prefix is not None:
+            if self._stills_writer is None:
+                self._stills_writer = threading.Thread(target=self._save_stills, name='thumbnail-stills', daemon=True)
+                self._stills_writer.start()
+            self._stills.put((pixels, number))
+
+    def finalize(self):
+        if self._stills_writer is not None:
+            self._stills.put(None)
+            self._stills_writer.join()
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = self.process.wait()
+            self._monitor.finish()
+            if returncode != 0:
+                raise RuntimeError(f"FFmpeg exited with code {returncode} while writing '{self.output_path}'")
+        if self._error is not None:
+            raise RuntimeError(f"Saving a thumbnail failed: {self._error}") from self._error
+
+    @property
+    def stats(self) -> dict:
+        return self._monitor.stats if self._monitor is not None else {}
+
 class FFmpegVideoProducer(AbstractVideoProducer):
     """
     A video producer that creates a video by piping raw image frames
     directly to an FFmpeg subprocess, avoiding intermediate files.
+
+    Frames are written in whatever pixel format the backend stores them in,
+    as returned by Img.as_buffer(), and FFmpeg does the conversion. Because
+    the format is only known once the first frame arrives, FFmpeg is started
+    then.
+
+    If glow_radius is set, FFmpeg applies the glow in its filter graph, and
+    frames should be added without calling Img.glow().
+
+    If queue_size is set, frames are copied into one of queue_size + 1
+    recycled buffers and written by a background thread, so rendering the
+    next frame overlaps with encoding this one. add_frame() blocks while all
+    the buffers are waiting to be written.
+
+    If gop is set, a keyframe is placed every gop frames.
+
+    Scenes are added with Scene.consume() and written from the buffer they
+    export, unless queue_size or frame_prep is set. A Panda3D scene writes
+    each frame from its own thread while it renders the next one, so the
+    frame isn't copied for a writer thread. finalize() waits for the last
+    frame.
+
+    If frame_prep is set, frames are scaled down to output_size and
+    converted to yuv420p in process by a FramePrep on prep_threads threads,
+    and only those much smaller frames go through the pipe. The area
+    average differs slightly from FFmpeg's Lanczos scaling. The glow can't
+    be left to FFmpeg then, since it has to be applied before scaling.
+
+    FFmpeg's progress is followed by an FFmpegMonitor, which warns when no
+    frame got through for stall_timeout seconds. stats adds how many frames
+    wait for the background writer, now and at most.
     """
-    def __init__(self, output_path: str, size: Tuple[int, int], output_size: Tuple[int, int], fps: int):
+    def __init__(self, output_path: str, size: Tuple[int, int], output_size: Tuple[int, int], fps: int, glow_radius: Optional[int] = None,
+                 queue_size: int = 0, gop: int = 0, stall_timeout: float = 30.0, frame_prep: bool = False, prep_threads: int = 4):
         super().__init__(output_path, size, fps)
+        if frame_prep and glow_radius is not None:
+            raise ValueError("FFmpeg can't apply the glow to frames that were already scaled down by the frame prep")
+        self.stall_timeout = stall_timeout
+        self._monitor: Optional[FFmpegMonitor] = None
+        self._max_queue_depth = 0
+        self.gop = gop
+        self.output_size = output_size
+        self.glow_radius = glow_radius
+        self.queue_size = queue_size
+        self.process: Optional[subprocess.Popen] = None
+        self._input_format: Optional[Tuple[str, bool]] = None
+        self._writer: Optional[threading.Thread] = None
+        # Buffers waiting to be written, and buffers free to be filled
+        self._pending: queue.Queue[Optional[bytearray]] = queue.Queue()
+        self._free: queue.Queue[bytearray] = queue.Queue()
+        self._allocated = 0
+        self._error: Optional[BaseException] = None
+        # The buffer being filled from strips by the background writer
+        self._filling: Optional[bytearray] = None
+        self._prep = FramePrep(size, output_size, prep_threads) if frame_prep else None
+        # The prepared frame when writing synchronously, reused every frame
+        self._prepared: Optional[bytearray] = None
+        # The next output row a strip is prepared into, and input rows left
+        # over from the last strip
+        self._prep_row = 0
+        self._carry: Optional[np.ndarray] = None
+        # The scene whose frames may still be being written
+        self._scene: Optional[Scene] = None
+
+    def _start(self, pix_fmt: str, bottom_up: bool):
+        self._input_format = (pix_fmt, bottom_up)
         width, height = self.size
+        filters: Optional[str] = f'scale={self.output_size[0]}:{self.output_size[1]}'
+        if self.glow_radius is not None:
+            filters = f'{glow_filter(self.glow_radius)},{filters}'
+        if bottom_up:
+            filters = f'vflip,{filters}'
+        if self._prep is not None:
+            # Frames arrive ready to encode
+            width, height = self.output_size
+            pix_fmt = 'yuv420p'
+            filters = None
 
         # The FFmpeg command to receive raw video data from stdin
         command = [
             'ffmpeg',
             '-y',  # Overwrite output file
+            *PROGRESS_ARGS,
             '-f', 'rawvideo',
             '-vcodec', 'rawvideo',
             '-s', f'{width}x{height}',
-            '-pix_fmt', 'rgb24',
+            '-pix_fmt', pix_fmt,
             '-r', str(self.fps),
             '-i', '-',  # Input from stdin
             '-c:v', 'libx264',
-            # scale down
-            '-vf', f'scale={output_size[0]}:{output_size[1]}',
-            '-sws_flags', 'lanczos',
-            '-pix_fmt', 'yuv420p',
-            self.output_path
         ]
+        if filters is not None:
+            # scale down
+            command += ['-vf', filters, '-sws_flags', 'lanczos']
+        command += ['-pix_fmt', 'yuv420p']
+        if self.gop:
+            command += ['-g', str(self.gop)]
+        command.append(self.output_path)
+
+        # Start the FFmpeg subprocess with a pipe to its stdin, and one from
+        # its stdout for the progress reports
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._monitor = FFmpegMonitor(self.process, self.output_path, self.stall_timeout, started=self._created)
+        if self.queue_size > 0:
+            self._writer = threading.Thread(target=self._write_frames, name='ffmpeg-writer', daemon=True)
+            self._writer.start()
 
-        # Start the FFmpeg subprocess with a pipe to its stdin
-        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    def _write_frames(self):
+        while True:
+            data = self._pending.get()
+            if data is None:
+                return
+            if self._error is None:
+                try:
+                    with trace.span('pipe write', 'video'):
+                        self._monitor.write(self.process.stdin, data)
+                except BaseException as e:
+                    # Keep draining so add_frame() never waits on a buffer
+                    self._error = e
+            self._free.put(data)
+
+    def _buffer(self, nbytes: int) -> bytearray:
+        # Reuse a written buffer, or allocate while under the limit
+        try:
+            data = self._free.get_nowait()
+        except queue.Empty:
+            if self._allocated <= self.queue_size:
+                self._allocated += 1
+                return bytearray(nbytes)
+            # All buffers are queued, FFmpeg is holding up rendering
+            with trace.span('wait for writer', 'video'), self._monitor.waiting():
+                data = self._free.get()
+        if len(data) != nbytes:
+            data = bytearray(nbytes)
+        return data
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(f"Writing to FFmpeg failed: {self._error}") from self._error
+        if self._monitor is not None:
+            self._monitor.check()
+
+    def _stdin(self, pix_fmt: str, bottom_up: bool):
+        if self.process is None:
+            self._start(pix_fmt, bottom_up)
+        elif self._input_format != (pix_fmt, bottom_up):
+            raise ValueError(f"Frame format {pix_fmt} (bottom up: {bottom_up}) doesn't match "
+                             f"the stream's {self._input_format[0]} (bottom up: {self._input_format[1]})")
+        if not self.process.stdin:
+            raise ValueError("Video stream is not initialized.")
+        self._check()
+        return self.process.stdin
 
     def add_frame(self, frame: Union[Img, Scene], number: int):
         """
-        Adds a single Pillow image frame to the video stream.
-        The frame must be in 'RGB' mode and match the specified size.
+        Adds a single frame to the video stream. The frame must match the
+        specified size.
         """
-        # Convert the Pillow image to raw bytes and write to the pipe
-        if not self.process.stdin:
-            raise ValueError("Video stream is not initialized.")
-        if isinstance(frame, Img):
-            self.process.stdin.write(frame.tobytes())
+        if isinstance(frame, Scene) and self.queue_size == 0 and self._prep is None:
+            self._scene = frame
+            frame.consume(self._write_buffer)
+            return
+        buffer = frame.as_buffer()
+        stdin = self._stdin(buffer.pix_fmt, buffer.bottom_up)
+        if self._prep is not None:
+            data = self._prepared_buffer()
+            with trace.span('frame prep', 'video'):
+                self._prep.convert(buffer, data)
+            self._send(stdin, data)
+            return
+        if self._writer is None:
+            self._send(stdin, buffer.data)
+            return
+        data = self._buffer(buffer.data.nbytes)
+        data[:] = buffer.data
+        self._queue(data)
+
+    def _write_buffer(self, buffer: FrameBuffer):
+        # Writes a scene's frame, possibly from the scene's thread
+        self._send(self._stdin(buffer.pix_fmt, buffer.bottom_up), buffer.data)
+
+    def _prepared_buffer(self) -> bytearray:
+        # A recycled buffer for the background writer, or the same one
+        # every frame when writing synchronously
+        if self._writer is not None:
+            return self._buffer(self._prep.frame_bytes)
+        if self._prepared is None:
+            self._prepared = bytearray(self._prep.frame_bytes)
+        return self._prepared
+
+    def _send(self, stdin, data, frames: int = 1):
+        # Writes or queues a finished frame
+        if self._writer is None:
+            with trace.span('pipe write', 'video'):
+                self._monitor.write(stdin, data, frames)
         else:
-            frame.consume_bytes(self.process.stdin.write)
+            self._queue(data)
+
+    def add_strip(self, strip: FrameBuffer, top: int, number: int):
+        """
+        Writes rows of a frame straight to FFmpeg, or into a recycled buffer
+        that is queued once the frame is complete.
+
+        With the frame prep, rows are prepared as soon as they make up
+        whole pairs of output rows, so the full size frame is never held.
+        """
+        if self._prep is not None and self._prep.rows_per_step is None:
+            super().add_strip(strip, top, number)
+            return
+        stdin = self._stdin(strip.pix_fmt, strip.bottom_up)
+        if self._prep is not None:
+            self._prepare_strip(stdin, strip, top)
+            return
+        data = strip.data.cast('B')
+        if self._writer is None:
+            # The last strip completes the frame
+            frames = 1 if top + strip.data.shape[0] == self.size[1] else 0
+            with trace.span('pipe write', 'video'):
+                self._monitor.write(stdin, data, frames)
+            return
+        row_bytes = data.nbytes // strip.data.shape[0]
+        if top == 0:
+            self._filling = self._buffer(row_bytes * self.size[1])
+        offset = top * row_bytes
+        self._filling[offset:offset + data.nbytes] = data
+        if offset + data.nbytes == len(self._filling):
+            self._queue(self._filling)
+            self._filling = None
+
+    def _prepare_strip(self, stdin, strip: FrameBuffer, top: int):
+        pixels = np.asarray(strip.data)
+        if top == 0:
+            self._filling = self._prepared_buffer()
+            self._prep_row = 0
+            self._carry = None
+        if self._carry is not None:
+            pixels = np.concatenate([self._carry, pixels])
+        step = self._prep.rows_per_step
+        usable = len(pixels) // step * step
+        if usable:
+            with trace.span('frame prep', 'video'):
+                self._prep.convert_rows(pixels[:usable], strip.pix_fmt, self._prep_row, self._filling)
+            self._prep_row += usable // self._prep.factor
+        self._carry = pixels[usable:].copy() if usable < len(pixels) else None
+        if top + strip.data.shape[0] == self.size[1]:
+            data, self._filling = self._filling, None
+            self._send(stdin, data)
+
+    def _queue(self, data: bytearray):
+        self._pending.put(data)
+        self._max_queue_depth = max(self._max_queue_depth, self._pending.qsize())
 
     def finalize(self):
         """
         Closes the video stream and waits for FFmpeg to finish processing.
         """
-        if self.process.stdin:
-            self.process.stdin.close()
-        self.process.wait()
+        scene, self._scene = self._scene, None
+        if scene is not None:
+            scene.flush()
+        if self.process is None:
+            self._start('rgb24', False)
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+        try:
+            if self.process.stdin:
+                self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        self._monitor.finish()
+        if self._prep is not None:
+            self._prep.close()
+        if self._error is not None:
+            raise RuntimeError(f"Writing to FFmpeg failed: {self._error}") from self._error
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg exited with code {returncode} while writing '{self.output_path}'")
         print(f"Video '{self.output_path}' finalized successfully. ✨")
+
+    @property
+    def stats(self) -> dict:
+        if self._monitor is None:
+            return {}
+        stats = self._monitor.stats
+        if self.queue_size > 0:
+            stats['queue_depth'] = self._pending.qsize()
+            stats['max_queue_depth'] = self._max_queue_depth
+        return stats
+
+def _to_bgr(data: bytes, buffer: FrameBuffer, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Converts a copy of an exported frame to a contiguous BGR array, top row
+    first, with OpenCV calls that release the GIL.
+    """
+    pixels = np.frombuffer(data, dtype=np.uint8).reshape((size[1], size[0], -1))
+    if buffer.bottom_up:
+        pixels = cv2.flip(pixels, 0)
+    if buffer.pix_fmt == 'bgr24':
+        return pixels
+    if buffer.pix_fmt == 'rgb24':
+        return cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+    if buffer.pix_fmt == 'bgr0':
+        return cv2.cvtColor(pixels, cv2.COLOR_BGRA2BGR)
+    return np.ascontiguousarray(pixels[:, :, [buffer.pix_fmt.index(channel) for channel in 'bgr']])
+
+class ImageSequenceProducer(AbstractVideoProducer):
+    """
+    Saves every frame as a numbered image file, encoding on a thread pool so
+    the render loop only pays for one copy of the frame. At most max_in_flight
+    frames are waiting or being encoded, after which add_frame() blocks.
+
+    Formats:
+        png: PNG at the given zlib level, 0 to 9. Level 1 is a good deal
+            faster than the libraries' defaults and barely larger.
+        ppm: Uncompressed binary PPM.
+        raw: The frame's bytes exactly as the backend exported them, with a
+            <prefix>.json index giving the size, FFmpeg pixel format, row
+            order and file of each frame.
+    """
+    FORMATS = ('png', 'ppm', 'raw')
+
+    def __init__(self, prefix: str, size: Tuple[int, int], fps: int, format: str = 'png', png_level: int = 1,
+                 threads: int = 4, max_in_flight: Optional[int] = None):
+        super().__init__(prefix, size, fps)
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown image sequence format: {format}")
+        self.prefix = prefix
+        self.format = format
+        self.png_level = png_level
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='image-sequence')
+        self._slots = threading.BoundedSemaphore(max_in_flight or threads * 2)
+        self._futures: list[Future] = []
+        self._index: list[dict] = []
+        # The file raw and PPM strips are being written to
+        self._file = None
+
+    def _path(self, number: int) -> str:
+        extension = 'bin' if self.format == 'raw' else self.format
+        return f"{self.prefix}_{number:06d}.{extension}"
+
+    def _write(self, data: bytes, buffer: FrameBuffer, path: str):
+        try:
+            if self.format == 'raw':
+                with open(path, 'wb') as f:
+                    f.write(data)
+            elif self.format == 'ppm':
+                cv2.imwrite(path, _to_bgr(data, buffer, self.size))
+            else:
+                cv2.imwrite(path, _to_bgr(data, buffer, self.size), [cv2.IMWRITE_PNG_COMPRESSION, self.png_level])
+        finally:
+            self._slots.release()
+
+    def _check(self):
+        # Surface the first failure, and forget frames that are done
+        pending = []
+        for future in self._futures:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self._futures = pending
+
+    def add_frame(self, frame: Union[Img, Scene], number: int):
+        self._check()
+        buffer = frame.as_buffer()
+        # The frame is gone once add_frame() returns, so take a copy
+        data = bytes(buffer.data)
+        buffer = buffer._replace(data=None)
+        path = self._path(number)
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(self._write, data, buffer, path))
+        self._index.append({'number': number, 'file': os.path.basename(path), 'pix_fmt': buffer.pix_fmt, 'bottom_up': buffer.bottom_up})
+
+    def add_strip(self, strip: FrameBuffer, top: int, number: int):
+        """
+        Writes raw and PPM frames to their file row by row as the strips
+        arrive, on the calling thread, so the frame is never assembled. PNG
+        frames are assembled and encoded on the pool as usual.
+        """
+        if self.format == 'png' or strip.pix_fmt != 'rgb24' or strip.bottom_up:
+            super().add_strip(strip, top, number)
+            return
+        if top == 0:
+            self._check()
+            path = self._path(number)
+            self._file = open(path, 'wb')
+            if self.format == 'ppm':
+                # The header cv2.imwrite() writes
+                self._file.write(f"P6\n{self.size[0]} {self.size[1]}\n255\n".encode())
+            self._index.append({'number': number, 'file': os.path.basename(path), 'pix_fmt': strip.pix_fmt, 'bottom_up': False})
+        self._file.write(strip.data.cast('B'))
+        if top + strip.data.shape[0] == self.size[1]:
+            self._file.close()
+            self._file = None
+
+    def finalize(self):
+        self._executor.shutdown(wait=True)
+        self._check()
+        if self.format == 'raw':
+            with open(f"{self.prefix}.json", 'w') as f:
+                json.dump({'width': self.size[0], 'height': self.size[1], 'fps': self.fps, 'frames': self._index}, f, indent=1)
+        print(f"Saved {len(self._index)} frames as {self.format} to '{self.prefix}_*'")
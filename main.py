@@ -1,17 +1,16 @@
-import math
 import os
 import argparse
-from animvideo.video import NoopProducer, GlobVideoProducer, FFmpegVideoProducer
-from animvideo.image import empty, set_use_opencv_for_glow, set_implementation
+from animvideo.video import NoopProducer, GlobVideoProducer, ThumbnailProducer, FFmpegVideoProducer, ImageSequenceProducer
+from animvideo.render import configure, render_frames, render_tiles, get_frame_cache, get_cull_stats
+from animvideo.plan import RenderPlan
+from animvideo.schedule import FrameSchedule
+from animvideo.segments import run_segments
+from animvideo.image import get_ring_sprite_cache, get_image_pool, get_implementation, release
+from animvideo import trace
 from animvideo.config import Config, Mode
 
 # https://youtu.be/a4Yge_o7XLg?si=YYmPQBmLYXq4cSoY at 1:10:30
 
-radians = math.radians
-
-def ncircles(disc_radius, radius):
-    return math.floor(math.pi / math.asin(radius / disc_radius))
-
 def parse_args() -> Config:
     default_values = Config()
 
@@ -23,8 +22,44 @@ def parse_args() -> Config:
     parser.add_argument('--scale-down', type=int, default=default_values.SCALE_DOWN, help='Scale down factor')
     parser.add_argument('--glow-combo', type=bool, default=default_values.GLOW_COMBO, help='Enable glow combo (pygame only)')
     parser.add_argument('--glow-radius', type=int, default=default_values.GLOW_RADIUS_BASE, help='Glow radius')
-    parser.add_argument('--image-impl', type=str, default=default_values.IMAGE_IMPL, choices=['pillow', 'pygame', 'opencv', 'panda3d'], help='Image implementation')
+    parser.add_argument('--glow-engine', type=str, default=default_values.GLOW_ENGINE, choices=['gaussian', 'pyramid'], help='Glow blur implementation (opencv, pygame and pillow)')
+    parser.add_argument('--glow-quality', type=float, default=default_values.GLOW_QUALITY, help='Accuracy of the pyramid glow engine')
+    parser.add_argument('--ffmpeg-glow', action='store_true', default=default_values.FFMPEG_GLOW, help='Apply the glow in the FFmpeg filter graph instead of in Python. Only the videos are glowed: the red_ring stills and --sequence frames are saved without glow')
+    parser.add_argument('--image-impl', type=str, default=default_values.IMAGE_IMPL, choices=['pillow', 'pygame', 'opencv', 'panda3d', 'numpy'], help='Image implementation')
+    parser.add_argument('--thumb-producer', type=str, default=default_values.THUMB_PRODUCER, choices=['stream', 'glob'],
+                        help='Stream scaled down thumbnails to FFmpeg, or save full size PNGs and encode them afterwards')
+    parser.add_argument('--sequence', type=str, default=default_values.SEQUENCE_FORMAT, choices=['', *ImageSequenceProducer.FORMATS],
+                        help='Also save every video frame as an image in this format')
+    parser.add_argument('--sequence-png-level', type=int, default=default_values.SEQUENCE_PNG_LEVEL, help='zlib level of PNG frames, 0 to 9')
+    parser.add_argument('--sequence-threads', type=int, default=default_values.SEQUENCE_THREADS, help='Threads saving image frames')
+    parser.add_argument('--thumb-interval', type=int, default=default_values.THUMB_INTERVAL, help='Save a thumbnail of frames that are a multiple of this')
+    parser.add_argument('--frames', type=lambda value: [int(frame) for frame in value.split(',')], default=default_values.FRAME_LIST,
+                        help='Comma separated frames to render instead of the range, e.g. 0,900,1800')
     parser.add_argument('--skip', type=int, default=default_values.SKIP, help='Skip frames')
+    parser.add_argument('--workers', type=int, default=default_values.WORKERS, help='Number of render processes')
+    parser.add_argument('--shared-frames', action='store_true', default=default_values.SHARED_FRAMES,
+                        help='Have render processes draw into shared memory slots instead of pickling frames back')
+    parser.add_argument('--no-cull', dest='cull', action='store_false', default=default_values.CULL, help='Draw every ring, including those off the canvas')
+    parser.add_argument('--writer-queue', type=int, default=default_values.WRITER_QUEUE, help='Frames to buffer for a background FFmpeg writer thread (0 writes synchronously)')
+    parser.add_argument('--segments', type=int, default=default_values.SEGMENTS, help='Render the video as this many segments in parallel processes and join them')
+    parser.add_argument('--gop', type=int, default=default_values.GOP, help='Frames between keyframes (0 is the encoder default, or up to one second with --segments)')
+    parser.add_argument('--ring-sprites', action='store_true', default=default_values.RING_SPRITES,
+                        help='Anti-alias rings by blending them through cached coverage masks (pillow, pygame and opencv); faster than cv2.circle with LINE_AA, slower than aliased circles, see README.md')
+    parser.add_argument('--ring-sprite-cache-mb', type=int, default=default_values.RING_SPRITE_CACHE_MB, help='Size limit of the ring sprite cache')
+    parser.add_argument('--frame-cache', type=str, default=default_values.FRAME_CACHE_DIR, help='Directory of rendered frames to reuse across runs (disabled if empty)')
+    parser.add_argument('--frame-cache-mb', type=int, default=default_values.FRAME_CACHE_MB, help='Size limit of the frame cache')
+    parser.add_argument('--tile-size', type=int, default=default_values.TILE_SIZE,
+                        help='Render and glow frames in tiles of this size and stream them in rows, in this process and without the frame cache (0 renders whole frames)')
+    parser.add_argument('--image-pool', type=int, default=default_values.IMAGE_POOL, help='Finished images to keep for reuse by later frames (0 allocates every frame)')
+    parser.add_argument('--trace', action='store_true', default=default_values.TRACE,
+                        help=f'Record a timeline of frames, drawing, glow and writing to {trace.TRACE_FILENAME} in the output directory, for Perfetto or chrome://tracing')
+    parser.add_argument('--ffmpeg-stall-timeout', type=float, default=default_values.FFMPEG_STALL_TIMEOUT,
+                        help='Warn when FFmpeg makes no progress for this many seconds (0 disables)')
+    parser.add_argument('--frame-prep', action='store_true', default=default_values.FRAME_PREP,
+                        help='Scale video frames down and convert them to yuv420p in process, so FFmpeg gets output sized frames')
+    parser.add_argument('--frame-prep-threads', type=int, default=default_values.FRAME_PREP_THREADS, help='Threads preparing video frames')
+    parser.add_argument('--profile-every', type=int, default=default_values.PROFILE_EVERY,
+                        help='Profile every Nth rendered frame with cProfile, saving profile_NNNNNN.prof in the output directory (0 disables)')
 
     parsed = parser.parse_args()
     return Config(
@@ -35,65 +70,119 @@ def parse_args() -> Config:
         SCALE_DOWN_BASE=parsed.scale_down,
         GLOW_COMBO=parsed.glow_combo,
         GLOW_RADIUS_BASE=parsed.glow_radius,
+        GLOW_ENGINE=parsed.glow_engine,
+        GLOW_QUALITY=parsed.glow_quality,
+        FFMPEG_GLOW=parsed.ffmpeg_glow,
         IMAGE_IMPL=parsed.image_impl,
-        SKIP=parsed.skip
+        SKIP=parsed.skip,
+        THUMB_PRODUCER=parsed.thumb_producer,
+        THUMB_INTERVAL=parsed.thumb_interval,
+        SEQUENCE_FORMAT=parsed.sequence,
+        SEQUENCE_PNG_LEVEL=parsed.sequence_png_level,
+        SEQUENCE_THREADS=parsed.sequence_threads,
+        FRAME_LIST=parsed.frames,
+        WORKERS=parsed.workers,
+        SHARED_FRAMES=parsed.shared_frames,
+        CULL=parsed.cull,
+        WRITER_QUEUE=parsed.writer_queue,
+        SEGMENTS=parsed.segments,
+        GOP=parsed.gop,
+        RING_SPRITES=parsed.ring_sprites,
+        RING_SPRITE_CACHE_MB=parsed.ring_sprite_cache_mb,
+        FRAME_CACHE_DIR=parsed.frame_cache,
+        FRAME_CACHE_MB=parsed.frame_cache_mb,
+        TILE_SIZE=parsed.tile_size,
+        IMAGE_POOL=parsed.image_pool,
+        TRACE=parsed.trace,
+        PROFILE_EVERY=parsed.profile_every,
+        FFMPEG_STALL_TIMEOUT=parsed.ffmpeg_stall_timeout,
+        FRAME_PREP=parsed.frame_prep,
+        FRAME_PREP_THREADS=parsed.frame_prep_threads
     )
 
-def create_video(config: Config):
+def create_video(config: Config, raise_errors: bool = False):
+    if config.SEGMENTS > 1 and config.MODE.enable_video and not config.FRAME_LIST:
+        run_segments(config, create_video)
+        return
     print(f"Creating video with {config}")
-    if config.GLOW_COMBO:
-        set_use_opencv_for_glow(True)
-    set_implementation(config.IMAGE_IMPL)
+    configure(config)
+    if config.TRACE:
+        trace.enable()
+        trace.instrument(get_implementation(), trace.IMAGE_METHODS, 'image')
+    trace.set_profiling(config.PROFILE_EVERY, config.output_path("profile"))
     try:
-        thumb_producer = producer = NoopProducer()
-        if config.MODE.enable_thumbs:
-            thumb_producer = GlobVideoProducer(config.output_path("thumbnails.mp4"), config.CANVAS_SIZE, config.FPS, config.output_path("red_ring"))
+        thumb_producer = producer = sequence_producer = NoopProducer()
+        ffmpeg_glow_radius = config.GLOW_RADIUS if config.FFMPEG_GLOW else None
+        if config.FFMPEG_GLOW and (config.MODE.enable_thumbs or (config.MODE.enable_video and config.SEQUENCE_FORMAT)):
+            print("Note: with --ffmpeg-glow only the videos are glowed, stills and image sequences are saved without glow")
+        if config.MODE.enable_thumbs and config.THUMB_PRODUCER == 'glob':
+            thumb_producer = GlobVideoProducer(config.output_path("thumbnails.mp4"), config.CANVAS_SIZE, config.FPS, config.output_path("red_ring"),
+                                               glow_radius=ffmpeg_glow_radius, stall_timeout=config.FFMPEG_STALL_TIMEOUT)
+        elif config.MODE.enable_thumbs:
+            thumb_producer = ThumbnailProducer(config.output_path("thumbnails.mp4"), config.CANVAS_SIZE, config.THUMB_SIZE, config.FPS,
+                                               stills_prefix=config.output_path("red_ring"), glow_radius=ffmpeg_glow_radius,
+                                               stall_timeout=config.FFMPEG_STALL_TIMEOUT)
         if config.MODE.enable_video:
-            output_size = config.CANVAS_SIZE if config.IMAGE_IMPL == 'panda3d' else (config.CANVAS_SIZE[0] // 2, config.CANVAS_SIZE[1] // 2)
-            producer = FFmpegVideoProducer(config.output_path("output.mp4"), config.CANVAS_SIZE, output_size, config.FPS)
-        start_frame = config.START_FRAME
-        end_frame = config.END_FRAME
-        print(f"Frames: {start_frame} to {end_frame}")
-        for add_rot in range(start_frame, end_frame, config.SKIP):
-            add_rot_f = add_rot / 2
-            image = empty(config.CANVAS_SIZE, (0, 0, 0))
-            def red_ring(level, rotation, adj):
-                rotprime = rotation * 6 % (2 * math.pi)
-                quadnum = int(rotation * 3 / (math.pi / 2))
-                cosine = abs(math.cos(rotprime))
-                if quadnum % 3 == 0:
-                    quadrant = config.COLORS0[level % len(config.COLORS0)]
-                else:
-                    quadrant = config.COLORS1[level % len(config.COLORS1)]
-                mult = 1 - math.pow(cosine, 2)
-                quadrant = (quadrant[0] * mult, quadrant[1] * mult, quadrant[2] * mult)
-
-                image.ring(color=quadrant,
-                    inner_radius=config.INNER_RADIUS, outer_radius=config.OUTER_RADIUS,
-                    center_x=config.CANVAS_SIZE[0] // 2 - level * config.OUTER_RADIUS * 2 - config.ADJUSTMENT, center_y=config.CANVAS_SIZE[1] // 2,
-                    rotation=rotation + adj
-                )
-            for level in range(1, config.LEVELS):
-                n = ncircles(level * config.OUTER_RADIUS * 2 + config.ADJUSTMENT, config.OUTER_RADIUS)
-                #print(f"Level {level}: {n} circles would fit.")
-                cnt = 0
-                rotation = 0.0
-                while rotation < 360.0:
-                    red_ring(level=level, rotation=radians(rotation), adj=radians(add_rot_f * (1.0 - level / config.LEVELS)))
-                    rotation += 360.0 / n
-                    cnt += 1
-                #print(f"Created {cnt} circles.")
-
-            image.glow(radius=config.GLOW_RADIUS)
-            if add_rot % 100 == 0:
-                thumb_producer.add_frame(image, add_rot)
-            producer.add_frame(image, add_rot)
-            image.destroy()
+            producer = FFmpegVideoProducer(config.output_path("output.mp4"), config.CANVAS_SIZE, config.OUTPUT_SIZE, config.FPS,
+                                           glow_radius=ffmpeg_glow_radius, queue_size=config.WRITER_QUEUE, gop=config.GOP,
+                                           stall_timeout=config.FFMPEG_STALL_TIMEOUT, frame_prep=config.FRAME_PREP,
+                                           prep_threads=config.FRAME_PREP_THREADS)
+        if config.MODE.enable_video and config.SEQUENCE_FORMAT:
+            sequence_producer = ImageSequenceProducer(config.output_path("frame"), config.CANVAS_SIZE, config.FPS, format=config.SEQUENCE_FORMAT,
+                                                      png_level=config.SEQUENCE_PNG_LEVEL, threads=config.SEQUENCE_THREADS)
+        for traced in (thumb_producer, producer, sequence_producer):
+            trace.instrument(type(traced), trace.PRODUCER_METHODS, 'video')
+        schedule = FrameSchedule.from_config(config)
+        if config.FRAME_LIST:
+            print(f"Frames: {', '.join(map(str, schedule.frames))}")
+        else:
+            print(f"Frames: {config.START_FRAME} to {config.END_FRAME}, rendering {len(schedule)}")
+        plan = RenderPlan.from_config(config)
+        if config.TILE_SIZE > 0:
+            for add_rot in trace.frames(schedule.frames):
+                for top, strip in render_tiles(config, plan, add_rot):
+                    if add_rot in schedule.thumbs:
+                        thumb_producer.add_strip(strip, top, add_rot)
+                    if add_rot in schedule.video:
+                        producer.add_strip(strip, top, add_rot)
+                        sequence_producer.add_strip(strip, top, add_rot)
+        else:
+            for add_rot, image in render_frames(config, plan, trace.frames(schedule.frames), workers=config.WORKERS,
+                                                shared=config.SHARED_FRAMES):
+                if add_rot in schedule.thumbs:
+                    thumb_producer.add_frame(image, add_rot)
+                if add_rot in schedule.video:
+                    producer.add_frame(image, add_rot)
+                    sequence_producer.add_frame(image, add_rot)
+                release(image)
         producer.finalize()
+        thumb_producer.finalize()
+        sequence_producer.finalize()
+        if producer.stats:
+            print(f"Video encoder: {producer.stats}")
+        if thumb_producer.stats:
+            print(f"Thumbnail encoder: {thumb_producer.stats}")
+        # Render workers keep their own counters, this process's stay at 0
+        rendered_here = config.WORKERS <= 1 or config.TILE_SIZE > 0
+        if config.CULL and rendered_here:
+            print(f"Rings culled: {get_cull_stats()}")
+        sprite_cache = get_ring_sprite_cache()
+        if sprite_cache is not None and rendered_here:
+            print(f"Ring sprite cache: {sprite_cache.stats}")
+        image_pool = get_image_pool()
+        if image_pool is not None and rendered_here:
+            print(f"Image pool: {image_pool.stats}")
+        frame_cache = get_frame_cache()
+        if frame_cache is not None and rendered_here:
+            print(f"Frame cache: {frame_cache.stats}")
     except Exception as e:
         print(f"An error occurred: {e}")
         import traceback
         traceback.print_exc()
+        if raise_errors:
+            raise
+    finally:
+        trace.finish(config.output_path(trace.TRACE_FILENAME))
 
 def main():
     config = parse_args()
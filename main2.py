@@ -4,6 +4,7 @@ import argparse
 from animvideo.scene import Panda3DScene
 from animvideo.config import Config
 from animvideo.video import FFmpegVideoProducer
+from animvideo import trace
 
 # https://youtu.be/a4Yge_o7XLg?si=YYmPQBmLYXq4cSoY at 1:10:30
 
@@ -23,6 +24,10 @@ def parse_args() -> Config:
     parser.add_argument('--glow-combo', type=bool, default=default_values.GLOW_COMBO, help='Enable glow combo (pygame only)')
     parser.add_argument('--glow-radius', type=int, default=default_values.GLOW_RADIUS_BASE, help='Glow radius')
     parser.add_argument('--skip', type=int, default=default_values.SKIP, help='Skip frames')
+    parser.add_argument('--trace', action='store_true', default=default_values.TRACE,
+                        help=f'Record a timeline of rendering and writing to {trace.TRACE_FILENAME} in the output directory, for Perfetto or chrome://tracing')
+    parser.add_argument('--profile-every', type=int, default=default_values.PROFILE_EVERY,
+                        help='Profile every Nth frame with cProfile, saving profile_NNNNNN.prof in the output directory (0 disables)')
 
     parsed = parser.parse_args()
     return Config(
@@ -32,28 +37,39 @@ def parse_args() -> Config:
         SCALE_DOWN_BASE=parsed.scale_down,
         GLOW_COMBO=parsed.glow_combo,
         GLOW_RADIUS_BASE=parsed.glow_radius,
-        SKIP=parsed.skip
+        SKIP=parsed.skip,
+        TRACE=parsed.trace,
+        PROFILE_EVERY=parsed.profile_every
     )
 
 def create_video(config: Config):
     print(f"Creating video with {config}")
+    if config.TRACE:
+        trace.enable()
+    trace.set_profiling(config.PROFILE_EVERY, config.output_path("profile"))
     try:
         producer = FFmpegVideoProducer(config.output_path("output.mp4"), config.CANVAS_SIZE, config.CANVAS_SIZE, config.FPS)
-        scene = Panda3DScene(config)
-        t = 0.0
+        trace.instrument(FFmpegVideoProducer, trace.PRODUCER_METHODS, 'video')
+        with trace.span('create scene', 'scene'):
+            scene = Panda3DScene(config)
+        trace.instrument(type(scene), trace.SCENE_METHODS, 'scene')
         step = 1.0 / config.FPS
-        while t < 1.0:
+        for number in trace.frames(range(config.FPS)):
+            t = number * step
             print(t)
-            producer.add_frame(scene, int(t * config.FPS))
-            t += step
             scene.time = t
+            producer.add_frame(scene, number)
 
         producer.finalize()
+        print(f"Video encoder: {producer.stats}")
+        print(f"Rings culled: {scene.cull_stats}")
         # scene.save(config.output_path("red_ring.png"))
     except Exception as e:
         print(f"An error occurred: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        trace.finish(config.output_path(trace.TRACE_FILENAME))
 
 def main():
     config = parse_args()
@@ -0,0 +1,25 @@
+#!/bin/bash
+# Render the golden frames without the in-process glow, apply FFmpeg's glow
+# filter graph to them and make sure they match the goldens closely. This
+# relies on --ffmpeg-glow saving the red_ring stills without glow, since
+# FFmpeg only glows the videos.
+#
+# Like the other scripts, run it from the repository root with uv.
+
+
+set -e
+
+OUTPUT=output-ffmpeg-glow
+MIN_PSNR=40
+
+uv run main.py --end-frame=1801 --scale-down=5 --mode=thumbs --skip=900 --thumb-producer=glob --ffmpeg-glow --output=$OUTPUT
+
+GLOW=$(uv run python -c "from animvideo.config import Config; from animvideo.video import glow_filter; print(glow_filter(Config(SCALE_DOWN_BASE=5).GLOW_RADIUS))")
+
+for file in tests/goldens/red_ring_*.png; do
+    psnr=$(ffmpeg -hide_banner -i "$OUTPUT/$(basename "$file")" -i "$file" \
+        -filter_complex "[0:v]$GLOW,format=rgb24[glowed];[glowed][1:v]psnr" -f null - 2>&1 \
+        | sed -n 's/.*PSNR.*average:\([0-9.]*\).*/\1/p')
+    echo "$(basename "$file"): PSNR $psnr"
+    awk -v psnr="$psnr" -v min="$MIN_PSNR" 'BEGIN { exit !(psnr >= min) }'
+done
@@ -9,7 +9,8 @@ then
     rm red_ring_*.png
 fi
 
-uv run main.py --end-frame=1801 --scale-down=5 --mode=thumbs --skip=9
+# Only the frames with goldens are rendered, as full size stills
+uv run main.py --frames=0,900,1800 --scale-down=5 --mode=thumbs --thumb-producer=glob
 
 for file in tests/goldens/red_ring_*.png; do
     cmp "output/$(basename "$file")" "$file"